@@ -0,0 +1,233 @@
+"""Resumable batch recognition of a directory tree of multi-digit pages.
+
+Pages are spread over a pool of worker processes. Each worker loads the model
+once when it starts and then segments and predicts one page per task. Every
+finished page becomes one JSON line in the output file:
+
+    {"path": "2024/batch1/010.png", "shape": [1200, 1600],
+     "boxes": [[x, y, w, h], ...], "corners": [[x0, y0, x1, y1], ...],
+     "digits": [4, 2, ...], "confidences": [0.99, ...], "numbers": [["42"], ...],
+     "timings": {"imread": 0.004, "threshold": 0.002, ..., "total": 0.031}}
+
+Pages that fail get {"path": ..., "error": "..."} instead. If a worker dies
+outright, every page in flight at that moment is recorded as failed and the
+job continues on a new pool; retry_errors picks them up on the next run. A
+pool that breaks before finishing any page stops the job instead.
+
+The output file doubles as the checkpoint. It is flushed and fsync'd every
+checkpoint_every pages. When the job is restarted with the same output file,
+pages already listed there are skipped, and a line left half-written by a
+crash is cut off first. With retry_errors, failed pages are processed again
+and the new line is appended after the old one. A nightly run can therefore
+be killed at any point and restarted without redoing finished pages.
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+import profiling
+from image_loader import IMAGE_EXTENSIONS, iter_image_paths
+from inference import DEFAULT_BATCH_SIZE, load_model, recognize_page
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+def load_finished(output_path, retry_errors=False):
+    """Return the set of page paths already recorded in output_path.
+
+    A trailing line without a newline (from a crash mid-write) is cut off so
+    that appending continues on a clean line. With retry_errors, pages that
+    failed before are not counted as finished.
+    """
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if retry_errors and 'error' in record:
+            continue
+        finished.add(record['path'])
+    return finished
+
+
+def _init_worker(model_path, settings, segmenter):
+    _worker['model'] = load_model(model_path) if model_path else None
+    _worker['settings'] = settings
+    _worker['segmenter'] = segmenter
+    # Stage timings of the current page are collected with the profiler
+    _worker['profiler'] = profiling.enable()
+
+
+def process_page(path, relative_path, batch_size=DEFAULT_BATCH_SIZE):
+    """Recognise one page in a worker and return its JSON-ready record."""
+    from grouping import group_digits, numbers_as_text
+
+    model = _worker['model']
+    profiler = _worker['profiler']
+    profiler.reset()
+    start = time.perf_counter()
+    try:
+        with profiling.stage('imread', items=1):
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("cannot read image")
+
+        result = recognize_page(gray, model, batch_size=batch_size,
+                                segmenter=_worker['segmenter'], **_worker['settings'])
+        digits = result.digits if model is not None else None
+        with profiling.stage('group', items=len(result.boxes)):
+            lines = group_digits(result.boxes, digits)
+    except Exception as exc:
+        return {'path': relative_path, 'error': f'{type(exc).__name__}: {exc}'}
+
+    timings = {name: stats['total_seconds'] for name, stats in profiler.as_dict().items()}
+    timings['total'] = time.perf_counter() - start
+    return {
+        'path': relative_path,
+        'shape': list(gray.shape),
+        'boxes': result.boxes.tolist(),
+        'corners': result.corners.tolist(),
+        'digits': result.digits.tolist(),
+        'confidences': np.round(result.confidences.astype(np.float64), 6).tolist(),
+        'numbers': numbers_as_text(lines) if model is not None else None,
+        'timings': {name: round(seconds, 6) for name, seconds in timings.items()},
+    }
+
+
+def run_batch(root, output_path, model_path=None, settings=None, segmenter=None,
+              workers=None, max_pending=None, checkpoint_every=100, retry_errors=False,
+              extensions=IMAGE_EXTENSIONS, batch_size=DEFAULT_BATCH_SIZE, verbose=True):
+    """Recognise every page under root, appending one JSON line per page to output_path.
+
+    settings: keyword arguments for recognize_page (segmentation settings,
+              invert, dilate)
+    segmenter: optional segmenter for recognize_page; it must be picklable,
+               e.g. functools.partial(tiling.segment_tiled, workers=1)
+    workers: worker processes, defaults to the number of CPUs
+    max_pending: pages queued at once, defaults to four per worker, so memory
+                 stays bounded however large the tree is
+    checkpoint_every: pages between fsyncs of the output file
+
+    Returns a dict with the number of processed, failed and skipped pages.
+    """
+    settings = settings or {}
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+
+    if model_path:
+        # A model that cannot be loaded would kill every worker in
+        # _init_worker; fail here once instead
+        load_model(model_path)
+
+    finished = load_finished(output_path, retry_errors)
+    counts = {'processed': 0, 'failed': 0, 'skipped': 0}
+
+    def todo():
+        for path in iter_image_paths(root, extensions, recursive=True):
+            relative_path = os.path.relpath(path, root)
+            if relative_path in finished:
+                counts['skipped'] += 1
+            else:
+                yield path, relative_path
+
+    pages = todo()
+    start = time.perf_counter()
+    since_checkpoint = 0
+
+    def start_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(model_path, settings, segmenter))
+
+    with open(output_path, 'a') as output:
+        executor = start_pool()
+
+        def checkpoint():
+            output.flush()
+            os.fsync(output.fileno())
+
+        def write(record):
+            nonlocal since_checkpoint
+            output.write(json.dumps(record) + '\n')
+            counts['failed' if 'error' in record else 'processed'] += 1
+            since_checkpoint += 1
+            if verbose and 'error' in record:
+                print(f"{record['path']}: {record['error']}", file=sys.stderr)
+
+        # Future -> relative path of the page it processes
+        pending = {}
+
+        def submit_more():
+            while len(pending) < max_pending:
+                page = next(pages, None)
+                if page is None:
+                    return
+                pending[executor.submit(process_page, *page, batch_size)] = page[1]
+
+        submit_more()
+        # Pages finished by the current pool
+        pool_pages = 0
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                broken = None
+                for future in done:
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool as error:
+                        broken = error
+                        continue
+                    del pending[future]
+                    write(record)
+                    pool_pages += 1
+
+                if broken is not None:
+                    if pool_pages == 0:
+                        # Workers that die before finishing a single page are
+                        # failing to start; a new pool would only fail again
+                        raise RuntimeError("worker processes died before finishing any page; "
+                                           "the pages in flight are not recorded") from broken
+                    # A worker died (e.g. killed for memory or crashed in
+                    # native code) and took the pool with it. Which page did
+                    # it is unknown, so every page still in flight is
+                    # recorded as failed and the job goes on with a new pool.
+                    for relative_path in pending.values():
+                        write({'path': relative_path, 'error': f'BrokenProcessPool: {broken}'})
+                    pending.clear()
+                    executor.shutdown(wait=False)
+                    executor = start_pool()
+                    pool_pages = 0
+
+                if since_checkpoint >= checkpoint_every:
+                    checkpoint()
+                    since_checkpoint = 0
+                    if verbose:
+                        done_pages = counts['processed'] + counts['failed']
+                        rate = done_pages / (time.perf_counter() - start)
+                        print(f"{done_pages} pages done ({rate:.1f} pages/s)", file=sys.stderr)
+                submit_more()
+        finally:
+            # Keep what has been written so far, even when interrupted
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+            checkpoint()
+
+    return counts
@@ -0,0 +1,277 @@
+"""Reproducible benchmarks for training, segmentation and inference throughput.
+
+Every stage runs on deterministic data (synthetic digits rendered with OpenCV,
+or the cached MNIST) and the results are written as JSON, so runs from
+different commits can be compared directly:
+
+    python mlcv_33085799.py bench --stages svc,segment,inference --output bench.json
+
+Stages:
+    svc        exact SVC and fast SVM fit and predict time
+    cnn        CNN seconds per epoch (needs TensorFlow)
+    inference  batched predict_digits throughput at several batch sizes
+    segment    pages per second of the segmentation pipeline, whole-page and
+               tiled, and whether the two find the same digits
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from contextlib import nullcontext
+
+import cv2
+import numpy as np
+
+STAGES = ('svc', 'cnn', 'inference', 'segment')
+DEFAULT_BATCH_SIZES = (1, 16, 64, 256)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def time_call(func, repeat=3):
+    """Run func repeat times and return (best_seconds, median_seconds, last_result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), float(np.median(times)), result
+
+
+def synthetic_digits(n, seed=0):
+    """Render n deterministic 28x28 digits (white on black) with random size and offset."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 10, n).astype(np.uint8)
+    images = np.zeros((n, 28, 28), dtype=np.uint8)
+    scales = rng.uniform(0.6, 0.9, n)
+    thicknesses = rng.integers(1, 3, n)
+    offsets = rng.integers(-2, 3, (n, 2))
+    for i in range(n):
+        cv2.putText(images[i], str(labels[i]), (7 + offsets[i, 0], 22 + offsets[i, 1]),
+                    cv2.FONT_HERSHEY_SIMPLEX, scales[i], 255, int(thicknesses[i]))
+    return images.reshape(n, 784), labels
+
+
+def synthetic_page(seed=0, height=1200, width=1600, num_digits=60):
+    """Render a deterministic grayscale page with dark digits on a light background."""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for _ in range(num_digits):
+        position = (int(rng.integers(0, width - 80)), int(rng.integers(80, height)))
+        cv2.putText(page, str(rng.integers(10)), position, cv2.FONT_HERSHEY_SIMPLEX,
+                    float(rng.uniform(1.5, 3)), 0, int(rng.integers(3, 8)))
+    return page
+
+
+def load_data(source, n_train, n_test, seed=0):
+    """Return (X_train, y_train, X_test, y_test) as flat uint8 arrays."""
+    if source == 'mnist':
+        from mnist_data import load_mnist
+
+        X, y = load_mnist()
+        order = np.random.default_rng(seed).permutation(len(X))
+        train, test = np.sort(order[:n_train]), np.sort(order[n_train:n_train + n_test])
+        return X[train], y[train], X[test], y[test]
+
+    X, y = synthetic_digits(n_train + n_test, seed)
+    return X[:n_train], y[:n_train], X[n_train:], y[n_train:]
+
+
+def bench_svc(data, repeat=1, n_pca=50, n_components=2000):
+    from sklearn.svm import SVC
+
+    from fast_svm import fit_and_score, make_fast_svm
+
+    X_train, y_train, X_test, y_test = data
+    # Nystroem cannot use more components than there are training samples
+    n_components = min(n_components, len(X_train))
+    results = {}
+    for name, make_model in (
+            ('exact', lambda: SVC(kernel='rbf', C=1.0, gamma='scale', max_iter=10000)),
+            ('fast', lambda: make_fast_svm(n_pca=n_pca, n_components=n_components))):
+        runs = [fit_and_score(make_model(), X_train, y_train, X_test, y_test)
+                for _ in range(repeat)]
+        results[name] = {
+            'fit_seconds': min(run[0] for run in runs),
+            'predict_seconds': min(run[1] for run in runs),
+            'predict_samples_per_second': len(X_test) / min(run[1] for run in runs),
+            'accuracy': runs[-1][2],
+        }
+    return results
+
+
+def bench_cnn(data, arch='small', epochs=2, batch_size=32):
+    import tensorflow as tf
+
+    from mlcv_33085799 import build_cnn
+    from tf_pipeline import make_dataset
+
+    X_train, y_train, _, _ = data
+    tf.keras.utils.set_random_seed(0)
+    train_data = make_dataset(X_train, y_train, batch_size=batch_size, seed=0)
+    model = build_cnn(arch)
+
+    epoch_times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        model.fit(train_data, epochs=1, verbose=0)
+        epoch_times.append(time.perf_counter() - start)
+
+    # The first epoch includes graph tracing, so report it separately
+    return {
+        'arch': arch,
+        'train_samples': len(X_train),
+        'first_epoch_seconds': epoch_times[0],
+        'epoch_seconds': float(np.median(epoch_times[1:])) if epochs > 1 else epoch_times[0],
+    }
+
+
+def bench_inference(model, data, batch_sizes=DEFAULT_BATCH_SIZES, repeat=3):
+    from inference import predict_digits
+
+    _, _, X_test, _ = data
+    images = X_test.reshape(-1, 28, 28)
+    results = {}
+    for batch_size in batch_sizes:
+        # Warm up once so one-off costs (graph tracing, BLAS threads) are excluded
+        predict_digits(images[:batch_size], model, batch_size=batch_size)
+        best, median, _ = time_call(
+            lambda: predict_digits(images, model, batch_size=batch_size), repeat)
+        results[str(batch_size)] = {
+            'seconds': best,
+            'median_seconds': median,
+            'digits_per_second': len(images) / best,
+        }
+    return results
+
+
+def bench_segment(num_pages=10, repeat=3, preset='eroded', tile_size=512):
+    from concurrent.futures import ProcessPoolExecutor
+
+    from mlcv_33085799 import SEGMENT_PRESETS
+    from segmentation import segment_digits
+    from tiling import check_parity, segment_tiled
+
+    settings = {key: value for key, value in SEGMENT_PRESETS[preset].items()
+                if key not in ('invert', 'dilate')}
+    pages = [synthetic_page(seed) for seed in range(num_pages)]
+
+    def run():
+        return sum(len(segment_digits(page, **settings).crops) for page in pages)
+
+    best, median, num_digits = time_call(run, repeat)
+
+    workers = os.cpu_count() or 1
+    # One pool for all pages, as the segment command uses, started outside
+    # the timed calls
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+        tiling = {'tile_size': tile_size, 'workers': workers, 'executor': pool}
+
+        def run_tiled():
+            return sum(len(segment_tiled(page, **tiling, **settings).crops) for page in pages)
+
+        # Let the workers start and import their modules before timing
+        run_tiled()
+        tiled_best, _, _ = time_call(run_tiled, repeat)
+        # The tiled segmenter must find the same digits as the whole-page one
+        parity = [check_parity(page, tiling, **settings) for page in pages]
+
+    return {
+        'preset': preset,
+        'pages': num_pages,
+        'page_shape': list(pages[0].shape),
+        'digits': num_digits,
+        'seconds': best,
+        'median_seconds': median,
+        'pages_per_second': num_pages / best,
+        'tiled_workers': workers,
+        'tiled_seconds': tiled_best,
+        'tiled_matches': all(not result['missing'] and not result['extra']
+                             and result['crops_equal'] for result in parity),
+    }
+
+
+def environment():
+    """Describe the code version and machine the benchmark ran on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(stages=STAGES, data_source='synthetic', n_train=5000, n_test=2000,
+                   model_path=None, batch_sizes=DEFAULT_BATCH_SIZES, repeat=3,
+                   cnn_epochs=2, num_pages=10, seed=0):
+    """Run the selected stages and return the results as a JSON-serialisable dict.
+
+    The inference stage uses the model at model_path, or a fast SVM trained on
+    the benchmark data when no model is given.
+    """
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"unknown benchmark stages: {sorted(unknown)}")
+
+    np.random.seed(seed)
+    data = load_data(data_source, n_train, n_test, seed)
+    report = {
+        'environment': environment(),
+        'config': {
+            'stages': list(stages), 'data': data_source, 'n_train': n_train, 'n_test': n_test,
+            'model': model_path, 'batch_sizes': list(batch_sizes), 'repeat': repeat,
+            'cnn_epochs': cnn_epochs, 'num_pages': num_pages, 'seed': seed,
+        },
+        'results': {},
+    }
+
+    for stage in stages:
+        peak_before = peak_rss_mb()
+        start = time.perf_counter()
+        if stage == 'svc':
+            result = bench_svc(data, repeat)
+        elif stage == 'cnn':
+            result = bench_cnn(data, epochs=cnn_epochs)
+        elif stage == 'inference':
+            if model_path:
+                from inference import load_model
+                model = load_model(model_path)
+            else:
+                from fast_svm import make_fast_svm
+                model = make_fast_svm(n_components=500).fit(data[0], data[1])
+            result = bench_inference(model, data, batch_sizes, repeat)
+        else:
+            result = bench_segment(num_pages, repeat)
+
+        result['stage_seconds'] = time.perf_counter() - start
+        # The high-water mark covers the whole process, so it includes the
+        # stages before this one; the increase is what this stage added on top
+        result['cumulative_peak_rss_mb'] = peak_rss_mb()
+        result['peak_rss_increase_mb'] = result['cumulative_peak_rss_mb'] - peak_before
+        report['results'][stage] = result
+        print(f"{stage}: done in {result['stage_seconds']:.2f}s", file=sys.stderr)
+
+    return report
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,236 @@
+"""Confidence-based cascade of digit classifiers.
+
+Most handwritten digits are easy: a cheap model (the fast SVM or the small
+CNN) already classifies them correctly and confidently. The cascade runs the
+cheapest stage on every digit and passes only the digits it is unsure about on
+to the next, more expensive stage (the RBF SVC or the deep CNN). The last stage
+answers whatever is left.
+
+A digit is accepted by a stage when its confidence reaches that stage's
+threshold. Confidence is either the margin between the two highest class
+probabilities ('margin') or the highest probability itself ('max'). calibrate
+picks the thresholds on a validation split: each stage accepts as many digits
+as it can while the cascade stays as accurate as running the later stages on
+everything (up to a tolerance).
+
+A calibrated cascade is saved as a small JSON file that lists the stage model
+files. inference.load_model loads it, so it can be used anywhere a single
+model can.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from inference import DEFAULT_BATCH_SIZE, load_model, predict_digits, stack_digits
+
+CONFIDENCE_MEASURES = ('margin', 'max')
+
+
+def confidence_scores(probabilities, measure='margin'):
+    """Confidence of each prediction: top-1 minus top-2 probability, or top-1."""
+    if measure not in CONFIDENCE_MEASURES:
+        raise ValueError(f"measure must be one of {CONFIDENCE_MEASURES}, got {measure!r}")
+    if probabilities.shape[1] < 2:
+        return np.ones(len(probabilities), dtype=np.float32)
+    top2 = np.partition(probabilities, -2, axis=1)[:, -2:]
+    if measure == 'max':
+        return top2[:, 1]
+    return top2[:, 1] - top2[:, 0]
+
+
+def _pick_threshold(confidence, correct, downstream_correct, tolerance):
+    """Lowest threshold keeping accuracy within tolerance of the downstream stages.
+
+    Samples are accepted in order of decreasing confidence; accepting the k
+    most confident ones gives an accuracy of
+    (correct among the first k + downstream correct among the rest) / n.
+    """
+    num_samples = len(confidence)
+    order = np.argsort(-confidence, kind='stable')
+    confidence = confidence[order]
+    accepted_correct = np.concatenate(([0], np.cumsum(correct[order])))
+    rest_correct = np.concatenate((np.cumsum(downstream_correct[order][::-1])[::-1], [0]))
+    accuracy = (accepted_correct + rest_correct) / num_samples
+
+    # A threshold can only split the samples between different confidences
+    splits = np.concatenate(([True], confidence[:-1] > confidence[1:], [True]))
+    allowed = splits & (accuracy >= accuracy[0] - tolerance)
+    k = np.flatnonzero(allowed)[-1]
+    if k == 0:
+        return np.inf
+    return float(confidence[k - 1])
+
+
+def read_config(path):
+    """Return (config, stage_paths) of a saved cascade, with the paths resolved."""
+    with open(path) as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    return config, [os.path.join(base, stage) for stage in config['stages']]
+
+
+class CascadeClassifier:
+    """Run classifiers from cheapest to most expensive, escalating unsure digits.
+
+    stages: models usable with inference.predict_digits, cheapest first
+    thresholds: confidence each stage needs to accept a digit; one per stage
+                except the last. Set them with calibrate.
+    measure: 'margin' or 'max', see confidence_scores
+    """
+
+    def __init__(self, stages, thresholds=None, measure='margin', stage_paths=None):
+        if len(stages) < 2:
+            raise ValueError("a cascade needs at least two stages")
+        if thresholds is not None and len(thresholds) != len(stages) - 1:
+            raise ValueError(f"expected {len(stages) - 1} thresholds, got {len(thresholds)}")
+        confidence_scores(np.zeros((0, 2)), measure)
+
+        self.stages = list(stages)
+        self.thresholds = list(thresholds) if thresholds is not None else None
+        self.measure = measure
+        self.stage_paths = stage_paths
+        self.reset_counts()
+
+    def reset_counts(self):
+        # Number of digits answered by each stage since the last reset
+        self.stage_counts = np.zeros(len(self.stages), dtype=np.int64)
+
+    @property
+    def escalation_rate(self):
+        """Fraction of digits that needed more than the first stage."""
+        total = self.stage_counts.sum()
+        return float(1 - self.stage_counts[0] / total) if total else 0.0
+
+    def predict_stages(self, images, batch_size=DEFAULT_BATCH_SIZE):
+        """Return (labels, probabilities, stage) with the stage that answered each digit."""
+        if self.thresholds is None:
+            raise RuntimeError("the cascade has no thresholds yet; call calibrate first")
+
+        images = stack_digits(images)
+        num_images = len(images)
+        labels = np.zeros(num_images, dtype=np.int64)
+        probabilities = None
+        answered_by = np.zeros(num_images, dtype=np.int64)
+
+        remaining = np.arange(num_images)
+        for index, model in enumerate(self.stages):
+            if len(remaining) == 0:
+                break
+            stage_labels, stage_probabilities = predict_digits(images[remaining], model, batch_size)
+            if probabilities is None:
+                probabilities = np.zeros((num_images, stage_probabilities.shape[1]), np.float32)
+
+            if index < len(self.thresholds):
+                confident = (confidence_scores(stage_probabilities, self.measure)
+                             >= self.thresholds[index])
+            else:
+                confident = np.ones(len(remaining), dtype=bool)
+
+            accepted = remaining[confident]
+            labels[accepted] = stage_labels[confident]
+            probabilities[accepted] = stage_probabilities[confident]
+            answered_by[accepted] = index
+            remaining = remaining[~confident]
+
+        if probabilities is None:
+            probabilities = np.empty((0, 0), dtype=np.float32)
+        self.stage_counts += np.bincount(answered_by, minlength=len(self.stages))
+        return labels, probabilities, answered_by
+
+    def predict_digits(self, images, batch_size=DEFAULT_BATCH_SIZE):
+        """Same contract as inference.predict_digits, which delegates here."""
+        labels, probabilities, _ = self.predict_stages(images, batch_size)
+        return labels, probabilities
+
+    def calibrate(self, images, labels, tolerance=0.0, batch_size=DEFAULT_BATCH_SIZE):
+        """Choose the thresholds on a validation split and return them.
+
+        tolerance: accuracy each stage may give up against letting the later
+                   stages answer everything, e.g. 0.001 for 0.1 percentage points
+        """
+        images = stack_digits(images)
+        labels = np.asarray(labels)
+
+        confidence = []
+        correct = []
+        for model in self.stages:
+            stage_labels, stage_probabilities = predict_digits(images, model, batch_size)
+            confidence.append(confidence_scores(stage_probabilities, self.measure))
+            correct.append(np.asarray(stage_labels).astype(np.int64) == labels)
+
+        # Work backwards, so each stage is compared with the calibrated
+        # cascade of the stages after it
+        thresholds = [None] * (len(self.stages) - 1)
+        downstream_correct = correct[-1]
+        for index in range(len(self.stages) - 2, -1, -1):
+            thresholds[index] = _pick_threshold(confidence[index], correct[index],
+                                                downstream_correct, tolerance)
+            downstream_correct = np.where(confidence[index] >= thresholds[index],
+                                          correct[index], downstream_correct)
+
+        self.thresholds = thresholds
+        return thresholds
+
+    def save(self, path):
+        """Write the thresholds and stage model paths to a .json file."""
+        if self.stage_paths is None:
+            raise ValueError("stage_paths are needed to save a cascade")
+        base = os.path.dirname(os.path.abspath(path))
+        config = {
+            'measure': self.measure,
+            # json has no infinity; a stage that never accepts is stored as null
+            'thresholds': [None if np.isinf(value) else float(value)
+                           for value in self.thresholds],
+            # Relative to the JSON file, so the folder can be moved as a whole
+            'stages': [os.path.relpath(os.path.abspath(stage), base) for stage in self.stage_paths],
+        }
+        with open(path, 'w') as f:
+            json.dump(config, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Load a cascade saved with save, loading every stage model."""
+        config, stage_paths = read_config(path)
+        thresholds = [np.inf if value is None else value for value in config['thresholds']]
+        return cls([load_model(stage) for stage in stage_paths], thresholds,
+                   config['measure'], stage_paths)
+
+
+def evaluate_cascade(cascade, images, labels, batch_size=DEFAULT_BATCH_SIZE):
+    """Compare the cascade with each of its stages on a test split.
+
+    Returns a dict with the accuracy and digits per second of every stage on
+    its own and of the cascade, plus the cascade's escalation rate.
+    """
+    images = stack_digits(images)
+    labels = np.asarray(labels)
+    report = {'stages': []}
+
+    for index, model in enumerate(cascade.stages):
+        start = time.perf_counter()
+        stage_labels, _ = predict_digits(images, model, batch_size)
+        seconds = time.perf_counter() - start
+        report['stages'].append({
+            'stage': index,
+            'path': cascade.stage_paths[index] if cascade.stage_paths else None,
+            'accuracy': float(np.mean(np.asarray(stage_labels).astype(np.int64) == labels)),
+            'digits_per_second': len(images) / seconds,
+        })
+
+    cascade.reset_counts()
+    start = time.perf_counter()
+    cascade_labels, _, answered_by = cascade.predict_stages(images, batch_size)
+    seconds = time.perf_counter() - start
+    report['cascade'] = {
+        'accuracy': float(np.mean(cascade_labels == labels)),
+        'digits_per_second': len(images) / seconds,
+        'escalation_rate': cascade.escalation_rate,
+        'answered_by_stage': np.bincount(answered_by, minlength=len(cascade.stages)).tolist(),
+        # As in save, a stage that never accepts has no finite threshold
+        'thresholds': [None if np.isinf(value) else float(value)
+                       for value in cascade.thresholds],
+    }
+    return report
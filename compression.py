@@ -0,0 +1,251 @@
+"""Smaller model artifacts: a compact RBF SVC and accuracy checks.
+
+A fitted sklearn SVC keeps every support vector as float64 and evaluates them
+through libsvm one sample at a time. CompactSVC keeps only what prediction
+needs:
+
+* the support vectors as uint8 when they are raw pixels (the SVC in this repo
+  is trained on 0-255 MNIST pixels, so this is lossless), otherwise float32;
+* the one-vs-one dual coefficients folded into one (n_support, n_pairs)
+  float32 matrix.
+
+The RBF kernel for a whole batch is then one float32 matrix product, and
+the pairwise decisions are a second one. With keep < 1 the model is also
+reduced to fewer support vectors. The ones with the largest dual coefficients
+are kept, and their weights are refitted by least squares so that the
+decision values on reference points (training digits, or the original support
+vectors when none are given) stay as close as possible to the full model's.
+
+The CNN counterpart, int8 weight quantisation, is numpy_cnn.quantize_npz.
+verify_artifact compares any compressed model with its original.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from inference import DEFAULT_BATCH_SIZE, load_model, predict_digits
+
+# Rows of the kernel matrix computed at once, to bound the memory of
+# (batch, n_support) float32 blocks
+KERNEL_CHUNK = 256
+
+
+def _pair_weights(dual_coef, n_support):
+    """Fold libsvm's one-vs-one dual coefficients into a (n_support, n_pairs) matrix.
+
+    For the pair (i, j), the support vectors of class i carry their
+    coefficients in row j - 1 of dual_coef and those of class j in row i.
+    """
+    n_classes = len(n_support)
+    starts = np.concatenate(([0], np.cumsum(n_support)))
+    pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+    weights = np.zeros((dual_coef.shape[1], len(pairs)), dtype=np.float64)
+    for p, (i, j) in enumerate(pairs):
+        class_i = slice(starts[i], starts[i + 1])
+        class_j = slice(starts[j], starts[j + 1])
+        weights[class_i, p] = dual_coef[j - 1, class_i]
+        weights[class_j, p] = dual_coef[i, class_j]
+    return weights, pairs
+
+
+class CompactSVC:
+    """Prediction-only RBF SVC with compact float32/uint8 storage.
+
+    Build one with compress_svc. It has predict and decision_function like the
+    original, so inference.predict_digits treats it as an sklearn model, and
+    predict_with_scores so that it only has to evaluate the kernel once.
+    """
+
+    def __init__(self, support_vectors, pair_weights, intercept, pairs, classes, gamma,
+                 transform=None):
+        self.support_vectors = support_vectors
+        self.pair_weights = pair_weights
+        self.intercept = intercept
+        self.pairs = pairs
+        self.classes_ = classes
+        self.gamma = gamma
+        # Preprocessing steps of a Pipeline ending in the SVC, if any
+        self.transform = transform
+
+    @property
+    def n_support(self):
+        return len(self.support_vectors)
+
+    def _pair_decisions(self, X):
+        if self.transform is not None:
+            X = self.transform.transform(X)
+        X = np.asarray(X, dtype=np.float32).reshape(len(X), -1)
+        vectors = self.support_vectors.astype(np.float32)
+        vector_norms = np.einsum('ij,ij->i', vectors, vectors)
+
+        decisions = np.empty((len(X), len(self.pairs)), dtype=np.float32)
+        for start in range(0, len(X), KERNEL_CHUNK):
+            chunk = X[start:start + KERNEL_CHUNK]
+            # ||x - v||^2 = ||x||^2 + ||v||^2 - 2 x.v, in place on the x.v block
+            kernel = chunk @ vectors.T
+            kernel *= -2
+            kernel += np.einsum('ij,ij->i', chunk, chunk)[:, None]
+            kernel += vector_norms
+            np.maximum(kernel, 0, out=kernel)
+            kernel *= -self.gamma
+            np.exp(kernel, out=kernel)
+            decisions[start:start + KERNEL_CHUNK] = kernel @ self.pair_weights
+        decisions += self.intercept
+        return decisions
+
+    def _votes(self, X):
+        decisions = self._pair_decisions(X)
+        n_classes = len(self.classes_)
+        votes = np.zeros((len(decisions), n_classes), dtype=np.float64)
+        confidences = np.zeros_like(votes)
+        for p, (i, j) in enumerate(self.pairs):
+            wins = decisions[:, p] > 0
+            votes[:, i] += wins
+            votes[:, j] += ~wins
+            confidences[:, i] += decisions[:, p]
+            confidences[:, j] -= decisions[:, p]
+        return votes, confidences
+
+    def decision_function(self, X):
+        """One-vs-rest scores built from the pairwise votes, as sklearn's SVC does."""
+        return self.predict_with_scores(X)[1]
+
+    def predict(self, X):
+        # Like libsvm, a tie in votes goes to the lowest class, whatever the scores
+        votes, _ = self._votes(X)
+        return self.classes_[np.argmax(votes, axis=1)]
+
+    def predict_with_scores(self, X):
+        """Return (predict(X), decision_function(X)) from one kernel evaluation."""
+        votes, confidences = self._votes(X)
+        # Scale the summed confidences into (-1/3, 1/3) so they only break ties
+        scores = votes + confidences / (3 * (np.abs(confidences) + 1))
+        return self.classes_[np.argmax(votes, axis=1)], scores
+
+
+def _rbf_kernel(A, B, gamma):
+    distances = (np.einsum('ij,ij->i', A, A)[:, None] + np.einsum('ij,ij->i', B, B)[None, :]
+                 - 2 * A @ B.T)
+    return np.exp(-gamma * np.maximum(distances, 0))
+
+
+def reduce_support_vectors(vectors, weights, gamma, keep, reference=None, max_reference=8000,
+                           random_state=0):
+    """Keep a fraction of the support vectors and refit their pair weights.
+
+    reference: points (in the SVC's input space) on which the reduced model
+               should reproduce the full decision values, ideally training
+               digits that are not support vectors; defaults to the support
+               vectors themselves
+    max_reference: reference points used at most, raised to twice the kept
+                   vectors so the least-squares fit stays overdetermined
+
+    Returns (kept_vectors, kept_weights).
+    """
+    num_kept = max(int(round(keep * len(vectors))), 1)
+    importance = np.abs(weights).max(axis=1)
+    kept = np.sort(np.argsort(-importance, kind='stable')[:num_kept])
+
+    if reference is None:
+        reference = vectors
+    reference = np.asarray(reference).reshape(len(reference), -1)
+    num_reference = max(max_reference, 2 * num_kept)
+    if len(reference) > num_reference:
+        rng = np.random.default_rng(random_state)
+        reference = reference[rng.choice(len(reference), num_reference, replace=False)]
+    if len(reference) <= num_kept:
+        raise ValueError(f"need more reference points than the {num_kept} kept support "
+                         f"vectors to refit their weights, got {len(reference)}")
+
+    vectors = np.asarray(vectors, dtype=np.float64)
+    kept_vectors = vectors[kept]
+    # Accumulate the normal equations K'K w = K'f over row chunks, so only a
+    # (chunk, n_support) block of the kernel matrix is ever held at once
+    gram = np.zeros((num_kept, num_kept))
+    projected = np.zeros((num_kept, weights.shape[1]))
+    for start in range(0, len(reference), 1024):
+        chunk = np.asarray(reference[start:start + 1024], dtype=np.float64)
+        # Decision values of the full model on these reference points
+        target = _rbf_kernel(chunk, vectors, gamma) @ weights
+        kernel = _rbf_kernel(chunk, kept_vectors, gamma)
+        gram += kernel.T @ kernel
+        projected += kernel.T @ target
+    refitted, *_ = np.linalg.lstsq(gram, projected, rcond=None)
+    return kept_vectors, refitted
+
+
+def compress_svc(model, keep=1.0, reference=None):
+    """Build a CompactSVC from a fitted RBF SVC (or a Pipeline ending in one).
+
+    keep: fraction of the support vectors to keep, see reduce_support_vectors;
+          1.0 is lossless apart from float32 rounding
+    reference: samples on which the reduced model is fitted, e.g. a few
+               thousand training digits; the Pipeline's transforms are applied
+               to them here
+    """
+    transform = None
+    if hasattr(model, 'steps'):
+        transform = model[:-1] if len(model.steps) > 1 else None
+        model = model.steps[-1][1]
+    if getattr(model, 'kernel', None) != 'rbf':
+        raise ValueError("only fitted SVCs with an RBF kernel can be compressed")
+
+    # sklearn stores the resolved gamma ('scale' / 'auto' already applied) in _gamma
+    gamma = float(model._gamma)
+    dual_coef, intercept = model.dual_coef_, model.intercept_
+    if len(model.classes_) == 2:
+        # For two classes sklearn negates libsvm's coefficients so that a
+        # positive decision means classes_[1]; the pair votes expect libsvm's
+        dual_coef, intercept = -dual_coef, -intercept
+    weights, pairs = _pair_weights(dual_coef, model.n_support_)
+    vectors = model.support_vectors_
+    if keep < 1.0:
+        if reference is not None:
+            reference = np.asarray(reference).reshape(len(reference), -1)
+            if transform is not None:
+                reference = transform.transform(reference)
+        vectors, weights = reduce_support_vectors(vectors, weights, gamma, keep, reference)
+
+    # Raw pixel support vectors fit in uint8 without any loss
+    if np.array_equal(vectors, np.clip(np.round(vectors), 0, 255)):
+        vectors = vectors.astype(np.uint8)
+    else:
+        vectors = vectors.astype(np.float32)
+
+    return CompactSVC(vectors, weights.astype(np.float32), intercept.astype(np.float32), pairs,
+                      model.classes_, gamma, transform)
+
+
+def verify_artifact(original, compressed, images, labels, batch_size=DEFAULT_BATCH_SIZE,
+                    original_path=None, compressed_path=None):
+    """Compare a compressed model with its original on labelled digits.
+
+    Returns a dict with the accuracy and digits per second of both models,
+    the fraction of digits on which they agree and, when the paths are given,
+    the file sizes and load times.
+    """
+    labels = np.asarray(labels).astype(np.int64)
+    report = {}
+    predictions = {}
+    for name, model, path in (('original', original, original_path),
+                              ('compressed', compressed, compressed_path)):
+        start = time.perf_counter()
+        predicted, _ = predict_digits(images, model, batch_size)
+        seconds = time.perf_counter() - start
+        predictions[name] = np.asarray(predicted).astype(np.int64)
+        entry = {
+            'accuracy': float(np.mean(predictions[name] == labels)),
+            'digits_per_second': len(labels) / seconds,
+        }
+        if path:
+            entry['path'] = path
+            entry['bytes'] = os.path.getsize(path)
+            start = time.perf_counter()
+            load_model(path)
+            entry['load_seconds'] = time.perf_counter() - start
+        report[name] = entry
+
+    report['agreement'] = float(np.mean(predictions['original'] == predictions['compressed']))
+    return report
@@ -0,0 +1,101 @@
+"""Fast approximate RBF SVM for MNIST.
+
+The exact SVC builds a kernel over every pair of training samples, so its cost
+grows faster than linearly with the number of digits. The fast mode below
+approximates the same RBF kernel instead:
+
+    PCA (with whitening) -> Nystroem or random Fourier features -> linear SVM
+
+Training is then linear in the number of samples, which makes it practical to
+fit on the full 70k set (or an augmented one).
+"""
+
+import time
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.metrics import accuracy_score
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+from sklearn.svm import SVC, LinearSVC
+
+
+def scale_pixels(X):
+    # uint8 pixels -> float32 in [0, 1]
+    return np.asarray(X, dtype=np.float32) / 255.0
+
+
+def make_fast_svm(n_pca=50, n_components=2000, kernel_approx='nystroem',
+                  gamma=None, whiten=True, C=1.0, random_state=42):
+    """Build the approximate RBF SVM pipeline.
+
+    n_pca: number of PCA components kept before the kernel map (None to skip PCA)
+    n_components: size of the approximate kernel feature space
+    kernel_approx: 'nystroem' or 'rff' (random Fourier features)
+    gamma: RBF width, defaults to 1 / n_pca, which is what gamma='scale'
+           gives on whitened PCA features; required when PCA is skipped
+    """
+    if kernel_approx not in ('nystroem', 'rff'):
+        raise ValueError(f"kernel_approx must be 'nystroem' or 'rff', got {kernel_approx!r}")
+
+    if gamma is None:
+        if not (n_pca and whiten):
+            raise ValueError("gamma must be given when PCA whitening is disabled")
+        gamma = 1.0 / n_pca
+
+    steps = [('scale', FunctionTransformer(scale_pixels))]
+    if n_pca:
+        steps.append(('pca', PCA(n_components=n_pca, whiten=whiten, random_state=random_state)))
+
+    if kernel_approx == 'nystroem':
+        feature_map = Nystroem(kernel='rbf', gamma=gamma, n_components=n_components,
+                               random_state=random_state)
+    else:
+        feature_map = RBFSampler(gamma=gamma, n_components=n_components,
+                                 random_state=random_state)
+    steps.append(('kernel', feature_map))
+    steps.append(('svm', LinearSVC(C=C, dual=False, random_state=random_state)))
+    return Pipeline(steps)
+
+
+def fit_and_score(model, X_train, y_train, X_test, y_test):
+    """Fit a model and return (train_seconds, predict_seconds, accuracy)."""
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    train_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_time = time.perf_counter() - start
+
+    return train_time, predict_time, accuracy_score(y_test, y_pred)
+
+
+def compare_with_exact(X_train, y_train, X_test, y_test, exact_result=None, fast_model=None,
+                       **fast_params):
+    """Train the fast SVM next to the exact SVC and print both timings.
+
+    exact_result: an existing (train_seconds, predict_seconds, accuracy) tuple
+    for the exact SVC, so an already trained baseline is not fitted again.
+    fast_model: an unfitted fast SVM to train, e.g. to keep and save it
+    afterwards; built from fast_params by default.
+
+    Returns a dict mapping 'exact' and 'fast' to their
+    (train_seconds, predict_seconds, accuracy) tuples.
+    """
+    if exact_result is None:
+        exact_model = SVC(kernel='rbf', C=1.0, gamma='scale', max_iter=10000)
+        exact_result = fit_and_score(exact_model, X_train, y_train, X_test, y_test)
+
+    results = {
+        'exact': exact_result,
+        'fast': fit_and_score(fast_model or make_fast_svm(**fast_params),
+                              X_train, y_train, X_test, y_test),
+    }
+
+    print(f"{'Model':<8}{'Train (s)':>12}{'Predict (s)':>14}{'Accuracy':>10}")
+    for name, (train_time, predict_time, accuracy) in results.items():
+        print(f"{name:<8}{train_time:>12.2f}{predict_time:>14.2f}{accuracy:>10.4f}")
+
+    return results
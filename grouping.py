@@ -0,0 +1,110 @@
+"""Grouping of segmented digits into multi-digit numbers and text lines.
+
+The notebook only compared each box with the previous one in left-to-right
+order against a fixed pixel distance, which breaks as soon as a page has more
+than one line. Here all box centroids go into a KD-tree and neighbouring
+pairs are found in one query. Pairs are linked when they are on the same line
+(vertical offset small compared with the median glyph height) and, for
+numbers, when the horizontal gap between their edges is small compared with
+the median glyph width. Connected components of those links give the lines
+and the numbers, so the thresholds adapt to the size of the handwriting.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+# indices: positions in the input boxes, left to right
+# box: (x0, y0, x1, y1) bounding box of the whole number
+# text: the digits joined into a string, or None when no digits were given
+Number = namedtuple('Number', ['indices', 'box', 'text'])
+
+# box: (x0, y0, x1, y1) bounding box of the line; numbers: left to right
+Line = namedtuple('Line', ['box', 'numbers'])
+
+
+def _components(num_boxes, pairs):
+    """Label the connected components of the graph with the given edges."""
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])),
+                       shape=(num_boxes, num_boxes))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def _split_by_label(indices, labels):
+    """Split indices into one array per distinct label."""
+    order = np.argsort(labels, kind='stable')
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    return np.split(indices[order], boundaries)
+
+
+def _bounding_box(corners):
+    return (int(corners[:, 0].min()), int(corners[:, 1].min()),
+            int(corners[:, 2].max()), int(corners[:, 3].max()))
+
+
+def group_digits(boxes, digits=None, line_tolerance=0.6, number_gap=0.5, line_gap=10.0):
+    """Group digit boxes into lines of numbers.
+
+    boxes: (N, 4) array of unpadded (x, y, w, h) digit boxes in any order
+    digits: optional predicted digit for every box, used to build the number text
+    line_tolerance: maximum vertical distance between the centres of two
+                    neighbouring boxes on one line, in median glyph heights
+    number_gap: maximum horizontal gap between the edges of two digits of the
+                same number, in median glyph widths
+    line_gap: maximum horizontal gap between neighbouring boxes still chained
+              into the same line, in median glyph widths
+
+    Returns a list of Line tuples, top to bottom.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    num_boxes = len(boxes)
+    if num_boxes == 0:
+        return []
+
+    x, y, w, h = boxes.T
+    centres = np.column_stack((x + w / 2, y + h / 2))
+    glyph_w = max(float(np.median(w)), 1.0)
+    glyph_h = max(float(np.median(h)), 1.0)
+
+    # One KD-tree query finds every pair that can possibly be on the same line.
+    # Coordinates are scaled so the Chebyshev radius 1 covers the largest
+    # horizontal reach and the vertical tolerance at the same time.
+    x_reach = w.max() + line_gap * glyph_w
+    y_reach = line_tolerance * glyph_h
+    tree = cKDTree(centres / (x_reach, y_reach))
+    pairs = tree.query_pairs(1.0, p=np.inf, output_type='ndarray')
+
+    # Horizontal gap between the box edges (0 when they overlap)
+    i, j = pairs.T
+    edge_gap = np.maximum(np.maximum(x[j] - (x[i] + w[i]), x[i] - (x[j] + w[j])), 0)
+
+    same_line = edge_gap <= line_gap * glyph_w
+    line_labels = _components(num_boxes, pairs[same_line])
+    same_number = same_line & (edge_gap <= number_gap * glyph_w)
+    number_labels = _components(num_boxes, pairs[same_number])
+
+    corners = np.column_stack((x, y, x + w, y + h))
+    lines = []
+    for members in _split_by_label(np.arange(num_boxes), line_labels):
+        numbers = []
+        for indices in _split_by_label(members, number_labels[members]):
+            indices = indices[np.argsort(centres[indices, 0], kind='stable')]
+            text = None
+            if digits is not None:
+                text = ''.join(str(digits[index]) for index in indices)
+            numbers.append(Number(indices.tolist(), _bounding_box(corners[indices]), text))
+
+        numbers.sort(key=lambda number: number.box[0])
+        lines.append(Line(_bounding_box(corners[members]), numbers))
+
+    lines.sort(key=lambda line: (line.box[1] + line.box[3]) / 2)
+    return lines
+
+
+def numbers_as_text(lines):
+    """Return the number strings of grouped lines as a list of lists."""
+    return [[number.text for number in line.numbers] for line in lines]
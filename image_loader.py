@@ -0,0 +1,87 @@
+"""Streaming, multi-threaded loading of handwritten digit image folders.
+
+Images are decoded and resized to 28x28 on a thread pool (OpenCV releases the
+GIL while it works) and handed out as fixed-size batches through a generator.
+Only a bounded number of images are in flight at once, so a folder with
+hundreds of thousands of scans is processed in constant memory and no
+full-resolution image is kept after it has been resized.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.png')
+
+
+def iter_image_paths(folder, extensions=IMAGE_EXTENSIONS, recursive=False):
+    """Yield the paths of image files in folder, in sorted order per directory."""
+    entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            if recursive:
+                yield from iter_image_paths(entry.path, extensions, recursive)
+        elif entry.name.lower().endswith(extensions):
+            yield entry.path
+
+
+def load_digit_image(path, size=(28, 28)):
+    """Read one image in grayscale and resize it, or return None if it cannot be decoded."""
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    return cv2.resize(image, size)
+
+
+def iter_image_batches(folder, batch_size=64, size=(28, 28), workers=None,
+                       max_pending=None, extensions=IMAGE_EXTENSIONS, recursive=False):
+    """Yield (paths, images) batches of preprocessed images from folder.
+
+    images is a (len(paths), 28, 28) uint8 array. Every batch except the last
+    holds exactly batch_size images; files that cannot be decoded are skipped.
+
+    workers: number of decoding threads, defaults to the number of CPUs
+    max_pending: maximum number of images being decoded at once, defaults to
+                 two batches, which bounds memory use regardless of folder size
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * batch_size
+
+    paths = iter_image_paths(folder, extensions, recursive)
+    batch = np.empty((batch_size, size[1], size[0]), dtype=np.uint8)
+    batch_paths = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def submit_next():
+            path = next(paths, None)
+            if path is not None:
+                pending.append((path, executor.submit(load_digit_image, path, size)))
+
+        for _ in range(max_pending):
+            submit_next()
+
+        # Results are consumed in submission order, so batches are deterministic
+        while pending:
+            path, future = pending.popleft()
+            submit_next()
+
+            image = future.result()
+            if image is None:
+                continue
+
+            batch[len(batch_paths)] = image
+            batch_paths.append(path)
+            if len(batch_paths) == batch_size:
+                yield batch_paths, batch.copy()
+                batch_paths = []
+
+    if batch_paths:
+        yield batch_paths, batch[:len(batch_paths)].copy()
@@ -0,0 +1,171 @@
+"""Batched digit prediction for the SVC and the CNN models.
+
+Calling a model once per digit pays the full sklearn/Keras dispatch overhead
+for every sample. predict_digits stacks all crops into one contiguous array and
+runs the model on fixed-size batches instead, and recognize_page runs the
+whole segmentation and prediction pipeline for one multi-digit page.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import stage
+
+DEFAULT_BATCH_SIZE = 256
+
+# boxes, corners and crops as returned by segmentation.segment_digits, plus the
+# predicted digit and its confidence for every crop (empty without a model)
+PageResult = namedtuple('PageResult', ['boxes', 'corners', 'crops', 'digits', 'confidences'])
+
+
+def load_model(model_path):
+    """Load an exported NumPy CNN (.npz), a Keras model (.h5 / .keras), a
+    cascade of models (.json) or a pickled sklearn model (.joblib / .pkl)."""
+    if model_path.endswith('.json'):
+        from cascade import CascadeClassifier
+        return CascadeClassifier.load(model_path)
+
+    if model_path.endswith('.npz'):
+        from numpy_cnn import NumpyCNN
+        return NumpyCNN.load(model_path)
+
+    if model_path.endswith(('.h5', '.keras')):
+        from tensorflow.keras.models import load_model as load_keras_model
+        return load_keras_model(model_path)
+
+    import joblib
+    return joblib.load(model_path)
+
+
+def stack_digits(images):
+    """Stack a list of 28x28 crops (or an existing array) into one contiguous array."""
+    if isinstance(images, np.ndarray):
+        return np.ascontiguousarray(images)
+    if len(images) == 0:
+        return np.empty((0, 28, 28), dtype=np.uint8)
+
+    first = np.asarray(images[0])
+    stacked = np.empty((len(images),) + first.shape, dtype=first.dtype)
+    for i, image in enumerate(images):
+        stacked[i] = image
+    return stacked
+
+
+def _is_keras_model(model):
+    return hasattr(model, 'predict_on_batch') and hasattr(model, 'input_shape')
+
+
+def _softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    np.exp(scores, out=scores)
+    scores /= scores.sum(axis=1, keepdims=True)
+    return scores
+
+
+def _predict_keras_batch(model, batch):
+    probabilities = np.asarray(model.predict_on_batch(batch.astype(np.float32)))
+    return np.argmax(probabilities, axis=1), probabilities
+
+
+def _predict_sklearn_batch(model, batch):
+    if hasattr(model, 'predict_with_scores'):
+        # Labels and scores from one evaluation, e.g. compression.CompactSVC
+        labels, scores = model.predict_with_scores(batch)
+        return labels, _softmax(np.asarray(scores, dtype=np.float64))
+
+    # Labels always come from predict: Platt-scaled probabilities and the
+    # one-vs-rest scores below do not always agree with its one-vs-one vote
+    labels = model.predict(batch)
+    if hasattr(model, 'predict_proba'):
+        probabilities = model.predict_proba(batch)
+    else:
+        # SVC without probability=True only has one-vs-rest scores, which are
+        # turned into a normalised confidence with a softmax
+        scores = np.asarray(model.decision_function(batch), dtype=np.float64)
+        if scores.ndim == 1:
+            # A binary model returns one score, positive for classes_[1]
+            scores = np.column_stack((-scores, scores))
+        probabilities = _softmax(scores)
+    return labels, probabilities
+
+
+def predict_digits(images, model, batch_size=DEFAULT_BATCH_SIZE):
+    """Predict the digit in every image with a single batched pass.
+
+    images: list of 28x28 crops or an array of shape (N, 28, 28), (N, 28, 28, 1)
+            or (N, 784)
+    model: a fitted sklearn classifier (e.g. the SVC), a Keras model, or any
+           object with its own predict_digits method such as a cascade
+    batch_size: number of digits passed to the model per call
+
+    Returns (labels, probabilities), where labels has shape (N,) and
+    probabilities has shape (N, n_classes).
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+    images = stack_digits(images)
+    num_images = len(images)
+    if num_images == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+
+    if hasattr(model, 'predict_digits'):
+        return model.predict_digits(images, batch_size)
+
+    if _is_keras_model(model):
+        images = images.reshape((num_images,) + tuple(model.input_shape[1:]))
+        predict_batch = _predict_keras_batch
+    else:
+        images = images.reshape(num_images, -1)
+        predict_batch = _predict_sklearn_batch
+
+    labels = probabilities = None
+    for start in range(0, num_images, batch_size):
+        batch = images[start:start + batch_size]
+        with stage('predict', size=batch.nbytes, items=len(batch)):
+            batch_labels, batch_probabilities = predict_batch(model, batch)
+
+        # Allocate the outputs once the label dtype and class count are known
+        if labels is None:
+            labels = np.empty(num_images, dtype=np.asarray(batch_labels).dtype)
+            probabilities = np.empty((num_images, batch_probabilities.shape[1]), dtype=np.float32)
+
+        labels[start:start + batch_size] = batch_labels
+        probabilities[start:start + batch_size] = batch_probabilities
+
+    return labels, probabilities
+
+
+def recognize_page(gray, model=None, invert=False, dilate=False,
+                   batch_size=DEFAULT_BATCH_SIZE, segmenter=None, **segment_settings):
+    """Segment a grayscale page and predict every digit on it.
+
+    invert / dilate: post-process the crops (255 - crop, 2x2 dilation) before
+                     prediction, as the notebook does for dark-on-light crops
+    segmenter: function segmenting the page, segmentation.segment_digits by
+               default; tiling.segment_tiled is a drop-in for large scans
+    segment_settings: keyword arguments for the segmenter
+
+    Returns a PageResult.
+    """
+    import cv2
+
+    from segmentation import segment_digits
+
+    segmentation = (segmenter or segment_digits)(gray, **segment_settings)
+    crops = segmentation.crops
+    if invert:
+        crops = 255 - crops
+    if dilate and len(crops):
+        kernel = np.ones((2, 2), np.uint8)
+        crops = np.stack([cv2.dilate(crop, kernel, iterations=1) for crop in crops])
+
+    if model is not None and len(crops):
+        digits, probabilities = predict_digits(crops, model, batch_size=batch_size)
+        confidences = probabilities.max(axis=1)
+    else:
+        digits = np.empty(0, dtype=np.int64)
+        confidences = np.empty(0, dtype=np.float32)
+
+    return PageResult(segmentation.boxes, segmentation.corners, crops, digits, confidences)
@@ -0,0 +1,344 @@
+"""Asynchronous local HTTP inference service with dynamic micro-batching.
+
+The trained model is loaded once. Every digit from every concurrent request
+goes into one queue, and a single batching task collects them into
+micro-batches (up to max_batch_size digits, waiting at most max_wait_ms after
+the first one arrives) before calling the model once per batch.
+
+Endpoints:
+    POST /predict/digit   body is one image file holding a single digit
+    POST /predict/page    body is one image file holding several digits
+    GET  /stats           latency percentiles and batch-size statistics (plus the
+                          escalation rate when the model is a cascade)
+
+Run with:
+    python inference_server.py --model my_mnist_model.h5 --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from grouping import group_digits, numbers_as_text
+from inference import PageResult, load_model, predict_digits
+from result_cache import ResultCache, cache_key, fingerprint_model
+from segmentation import segment_digits
+
+# Number of recent requests and batches kept for the statistics
+STATS_WINDOW = 10000
+
+
+class ServerStats:
+    """Rolling latency and batch-size statistics."""
+
+    def __init__(self, window=STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.digits = 0
+
+    def record_request(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.digits += size
+        self.batch_sizes.append(size)
+
+    def as_dict(self):
+        latencies_ms = np.asarray(self.latencies) * 1000
+        batch_sizes = np.asarray(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'digits': self.digits,
+            'latency_p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+            'latency_p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+            'batch_size_mean': float(batch_sizes.mean()) if len(batch_sizes) else None,
+            'batch_size_p50': float(np.percentile(batch_sizes, 50)) if len(batch_sizes) else None,
+            'batch_size_max': int(batch_sizes.max()) if len(batch_sizes) else None,
+        }
+
+
+class MicroBatcher:
+    """Coalesce digits from concurrent requests into batched model calls."""
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=5.0, stats=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats or ServerStats()
+        self.queue = asyncio.Queue()
+        # One thread so model calls never overlap and the event loop stays free
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def predict(self, crops):
+        """Queue (N, 28, 28) crops and wait for their (labels, confidences)."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for crop in crops:
+            future = loop.create_future()
+            self.queue.put_nowait((crop, future))
+            futures.append(future)
+
+        results = await asyncio.gather(*futures)
+        return [label for label, _ in results], [confidence for _, confidence in results]
+
+    async def _collect_batch(self):
+        # Block for the first item, then keep collecting until the batch is
+        # full or max_wait has passed since the first item arrived
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            crops = [crop for crop, _ in batch]
+            try:
+                labels, probabilities = await loop.run_in_executor(
+                    self.executor, predict_digits, crops, self.model, len(crops))
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self.stats.record_batch(len(batch))
+            for (_, future), label, row in zip(batch, labels, probabilities):
+                if not future.done():
+                    future.set_result((label.item(), float(row.max())))
+
+
+class BadRequest(ValueError):
+    """A problem with the request itself, answered with 400 instead of 500."""
+
+
+def decode_image(body):
+    """Decode an uploaded image file to a grayscale array."""
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise BadRequest("request body is not a readable image")
+    return image
+
+
+def _decode_and_segment(body, settings):
+    return segment_digits(decode_image(body), **settings)
+
+
+def _decode_digit(body, invert):
+    gray = decode_image(body)
+    if invert:
+        gray = 255 - gray
+    return cv2.resize(gray, (28, 28))[np.newaxis]
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer, got {params[name]!r}") from None
+
+
+class InferenceServer:
+    """Minimal HTTP/1.1 front end for the micro-batcher."""
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=5.0, cache=None,
+                 model_fingerprint='', segment_workers=None):
+        self.model = model
+        self.stats = ServerStats()
+        self.batcher = MicroBatcher(model, max_batch_size, max_wait_ms, self.stats)
+        # Images are decoded (and pages segmented) off the event loop, since
+        # OpenCV releases the GIL, so a large upload does not stall other
+        # requests or batching
+        self.segment_executor = ThreadPoolExecutor(max_workers=segment_workers)
+        # Optional ResultCache so repeated pages skip segmentation and the model
+        self.cache = cache
+        self.model_fingerprint = model_fingerprint
+
+    async def handle_digit(self, body, params):
+        loop = asyncio.get_running_loop()
+        crops = await loop.run_in_executor(self.segment_executor, _decode_digit, body,
+                                           params.get('invert', '0') == '1')
+        digits, confidences = await self.batcher.predict(crops)
+        return {'digit': digits[0], 'confidence': confidences[0]}
+
+    async def handle_page(self, body, params):
+        threshold = params.get('threshold', 'otsu')
+        settings = {
+            'threshold': threshold if threshold == 'otsu' else _int_param(params, 'threshold', 0),
+            'padding': _int_param(params, 'padding', 0),
+            'crop_from': 'binary',
+        }
+
+        key = result = None
+        if self.cache is not None:
+            key = cache_key(body, settings, self.model_fingerprint)
+            result = self.cache.get(key)
+
+        if result is None:
+            loop = asyncio.get_running_loop()
+            segmentation = await loop.run_in_executor(self.segment_executor, _decode_and_segment,
+                                                      body, settings)
+            digits, confidences = await self.batcher.predict(segmentation.crops)
+            result = PageResult(segmentation.boxes, segmentation.corners, segmentation.crops,
+                                np.asarray(digits), np.asarray(confidences, dtype=np.float32))
+            if self.cache is not None:
+                self.cache.put(key, result)
+
+        return {
+            'digits': result.digits.tolist(),
+            'confidences': result.confidences.tolist(),
+            'boxes': result.corners.tolist(),
+            'numbers': numbers_as_text(group_digits(result.boxes, result.digits)),
+        }
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if method == 'GET' and url.path == '/stats':
+            stats = self.stats.as_dict()
+            if self.cache is not None:
+                stats['cache'] = self.cache.stats()
+            if hasattr(self.model, 'escalation_rate'):
+                # Cascade: how often the cheap first stage was not confident enough
+                stats['cascade'] = {'escalation_rate': self.model.escalation_rate,
+                                    'answered_by_stage': self.model.stage_counts.tolist()}
+            return 200, stats
+        if method == 'POST' and url.path == '/predict/digit':
+            return 200, await self.handle_digit(body, params)
+        if method == 'POST' and url.path == '/predict/page':
+            return 200, await self.handle_page(body, params)
+        return 404, {'error': f'no route for {method} {url.path}'}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Where the next request starts is unknown, so answer and close
+                    self.write_response(writer, 400, {'error': 'malformed request line or '
+                                                                'Content-Length'}, False)
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length)
+
+                start = time.perf_counter()
+                try:
+                    status, payload = await self.route(method, target, body)
+                except BadRequest as error:
+                    status, payload = 400, {'error': str(error)}
+                except Exception as error:
+                    # Model or pipeline failures are the server's fault; answer
+                    # instead of dropping the connection
+                    traceback.print_exc()
+                    status, payload = 500, {'error': f'{type(error).__name__}: {error}'}
+                if status == 200 and method == 'POST':
+                    self.stats.record_request(time.perf_counter() - start)
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def write_response(writer, status, payload, keep_alive):
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                  500: 'Internal Server Error'}[status]
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.segment_executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', required=True, help="path to the trained model file")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--cache-entries', type=int, default=1024,
+                        help="pages kept in the in-memory result cache (0 to disable)")
+    parser.add_argument('--cache-dir', help="also keep cached page results on disk here")
+    parser.add_argument('--cache-max-mb', type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache_entries > 0:
+        cache = ResultCache(args.cache_entries, args.cache_dir, args.cache_max_mb << 20)
+
+    server = InferenceServer(load_model(args.model), args.max_batch_size, args.max_wait_ms,
+                             cache=cache, model_fingerprint=fingerprint_model(args.model))
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
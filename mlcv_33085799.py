@@ -6,468 +6,718 @@ Automatically generated by Colab.
 Original file is located at
     https://colab.research.google.com/drive/1Umos8V_irKouqxiisJFmOc3fT1fgecF_
 
-The Python libraries required for machine learning, image processing, charting, and numerical operations are imported in this section.
+Handwritten digit recognition with an SVC and two CNNs trained on MNIST.
+
+Each stage of the original notebook is now a subcommand, and every heavy
+library (TensorFlow, scikit-learn, OpenCV, matplotlib) is imported only by the
+subcommand that needs it, so e.g. a single prediction no longer pays for
+training two models:
+
+    python mlcv_33085799.py train-svc --output svc_model.joblib
+    python mlcv_33085799.py search-svc --train-size 20000
+    python mlcv_33085799.py train-cnn --arch small --export-npz my_mnist_model.npz
+    python mlcv_33085799.py cascade fast_svm.joblib svc_model.joblib --output cascade.json
+    python mlcv_33085799.py compress svc_model.joblib --keep 0.5
+    python mlcv_33085799.py predict --model my_mnist_model.npz digits/
+    python mlcv_33085799.py segment --preset eroded --model my_model2.h5 013.png
+    python mlcv_33085799.py batch --model my_model2.h5 --output results.jsonl scans/
+    python mlcv_33085799.py bench --output bench.json
 """
 
-import numpy as np
-import cv2
-import os
-import skimage
-import matplotlib.pyplot as plt
-from sklearn.datasets import fetch_openml
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.svm import SVC
-from sklearn.metrics import accuracy_score, classification_report
+import argparse
+import sys
+
+# Segmentation settings of the four multi-digit examples in the notebook
+SEGMENT_PRESETS = {
+    # 010.png: fixed threshold, crops cut from the grayscale page
+    'plain': dict(threshold=0, padding=0, crop_from='gray'),
+    # 011.png: Otsu threshold and padding so the number is more in the centre,
+    # crops are inverted and dilated so the number is more clear
+    'padded': dict(threshold='otsu', padding=20, crop_from='gray', invert=True, dilate=True),
+    # 012.png: 25x25 Gaussian blur to reduce noise before Otsu thresholding
+    'blurred': dict(threshold='otsu', blur_ksize=(25, 25), padding=100, crop_from='binary'),
+    # 013.png: erosion with a 3x5 kernel to separate touching digits
+    'eroded': dict(threshold='otsu', erode_kernel=(3, 5), padding=10, crop_from='binary'),
+}
+
+
+def load_svc_split():
+    """Load MNIST from the local cache and keep 30% of it aside for testing."""
+    from sklearn.model_selection import train_test_split
+
+    from mnist_data import load_mnist
+
+    X, y = load_mnist()
+    print("Shape of Images: {} \nShape of Labels: {}".format(X.shape, y.shape))
+    return train_test_split(X, y, test_size=0.3, random_state=42)
 
-"""The 70,000 handwritten digits that make up the MNIST dataset are loaded. The photographs are in X, and the labels that go with each image are in Y."""
 
-mnist = fetch_openml('mnist_784', version=1)
-X, y = mnist["data"], mnist["target"]
+def show_predictions(images, labels, num_cols=5, title='Predicted Digit'):
+    """Show the images in a grid, each titled with its predicted label."""
+    import matplotlib.pyplot as plt
 
-"""The dataset is partitioned into training and testing sets, allocating 30% of the data for testing purposes. This aids in verifying the model's performance on data that has not been previously encountered.
+    num_images = len(images)
+    num_rows = max(-(-num_images // num_cols), 1)
+    fig, axes = plt.subplots(num_rows, num_cols, figsize=(2 * num_cols, 2 * num_rows),
+                             squeeze=False)
+    for i, ax in enumerate(axes.flat):
+        if i < num_images:
+            ax.imshow(images[i].reshape(28, 28), cmap='gray')
+            ax.set_title(f'{title}: {labels[i]}')
+        # Extra subplots without an image are hidden as well
+        ax.axis('off')
+    plt.tight_layout()
+    plt.show()
+
+
+def train_svc(args):
+    """Train the RBF SVC, print its accuracy and classification report and save it.
+
+    With --fast the approximate SVM (PCA, kernel approximation and a linear
+    solver) is trained as well and compared against the exact SVC.
+    """
+    import time
+
+    import joblib
+    from sklearn.metrics import accuracy_score, classification_report
+    from sklearn.svm import SVC
+
+    from inference import predict_digits
+
+    X_train, X_test, y_train, y_test = load_svc_split()
+
+    model = SVC(kernel='rbf', C=args.C, gamma=args.gamma, max_iter=args.max_iter)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    train_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_time = time.perf_counter() - start
+
+    accuracy = accuracy_score(y_test, y_pred)
+    print(f"Accuracy on Test Data: {accuracy:.2f}")
+    print("\nClassification Report:")
+    print(classification_report(y_test, y_pred))
+
+    if args.fast or args.fast_output:
+        from fast_svm import compare_with_exact, make_fast_svm
+
+        fast_model = make_fast_svm(n_pca=args.n_pca, n_components=args.n_components,
+                                   kernel_approx=args.kernel_approx)
+        compare_with_exact(X_train, y_train, X_test, y_test,
+                           exact_result=(train_time, predict_time, accuracy),
+                           fast_model=fast_model)
+        if args.fast_output:
+            # The fast SVM is a cheap first stage for a cascade
+            joblib.dump(fast_model, args.fast_output)
+            print(f"Saved fast SVM to {args.fast_output}")
+
+    joblib.dump(model, args.output)
+    print(f"Saved SVC to {args.output}")
+
+    if args.plot:
+        predicted, _ = predict_digits(X_test[:10], model)
+        show_predictions(X_test[:10], predicted, title='Predicted Number')
+
+
+def search_svc(args):
+    """Tune C and gamma of the SVC with successive halving and save the best model."""
+    import joblib
+
+    from hyperparameter_search import DEFAULT_PARAM_GRID, print_search_report, search_svc
+    from inference import predict_digits
+
+    X_train, X_test, y_train, y_test = load_svc_split()
+    if args.train_size:
+        X_train, y_train = X_train[:args.train_size], y_train[:args.train_size]
+
+    param_grid = dict(DEFAULT_PARAM_GRID)
+    if args.C:
+        param_grid['svc__C'] = [float(value) for value in args.C.split(',')]
+    if args.gamma:
+        param_grid['svc__gamma'] = [value if value in ('scale', 'auto') else float(value)
+                                    for value in args.gamma.split(',')]
 
-"""
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
-print("Shape of Images: {} \nShape of Labels: {}".format(X.shape, y.shape))
-
-"""The training data is used to initialise and train a Support Vector Machine (SVM) model with a radial basis function (rbf) kernel."""
-
-model = SVC(kernel='rbf', C=1.0, gamma='scale', max_iter=10000)
-model.fit(X_train, y_train)
-
-"""The model is used to make predictions regarding the distribution of labels for the test set, and the precision of these predictions is computed and displayed."""
-
-y_pred = model.predict(X_test)
-
-accuracy = accuracy_score(y_test, y_pred)
-print(f"Accuracy on Test Data: {accuracy:.2f}")
-
-"""This section prints a detailed classification report, which includes precision, recall, f1-score, and support for each class."""
-
-print("\nClassification Report:")
-print(classification_report(y_test, y_pred))
-
-"""The performance of a machine learning model trained on the MNIST dataset has been assessed in this script through the visualisation of its predictions. I chose 10 test photographs, resized them to their original dimensions of 28x28 pixels, and presented each image in a grid along with the anticipated label of the model, as shown above. This method enables a rapid and unambiguous evaluation of the model's ability to reliably recognise handwritten digits."""
-
-import warnings
-
-warnings.filterwarnings("ignore")
-
-num_samples = 10
-
-# Define the number of columns
-num_cols = 5
-
-# Determine the number of rows based on the number of images and the number of columns
-num_rows = (num_samples + 1) // num_cols
-
-# Set the figure size to adjust the image size
-plt.figure(figsize=(5 * num_cols, 5 * num_rows))
-
-# Iterate over a sample of test data
-for i in range(num_samples):
-    # Get the image and its corresponding label
-    image = X_test.iloc[i].values.reshape(28, 28)  # Convert DataFrame to numpy array and reshape
-    label = y_test.iloc[i]
-
-    # Predict the number in the image
-    predicted_number = model.predict([X_test.iloc[i]])[0]  # Predict using iloc to access rows
-
-    # Plot the image
-    plt.subplot(num_rows, num_cols, i + 1)
-    plt.imshow(image, cmap='gray')
-    plt.title(f"Predicted Number: {predicted_number}")
-    plt.axis('off')
-
-plt.tight_layout()
-plt.show()
-
-"""In this script, I'm gathering grayscale images from a folder in my Google Drive, filtering for files that end with ".jpg" or ".png". I construct the filepath for each image, load it in grayscale using OpenCV's cv2.imread, and then append each image to the handwritten_images list for further analysis."""
-
-image_folder = '/content/drive/MyDrive/MachineLearning-Single'  # Change this to your Google Drive folder containing images
-handwritten_images = []
-for filename in os.listdir(image_folder):
-    if filename.endswith(".jpg") or filename.endswith(".png"):
-        filepath = os.path.join(image_folder, filename)
-        image = cv2.imread(filepath, cv2.IMREAD_GRAYSCALE)
-        handwritten_images.append(image)
-
-"""In this section of the script, the collected photos are being preprocessed to ensure that they are in a consistent format that is appropriate for input into the model. The photos in the handwritten_images list are resized to a resolution of 28x28 pixels using the cv2.resize function in OpenCV. This process ensures that the proportions of all images are standardised.
-
-Following the process of resizing, the list of photographs is transformed into a NumPy array, which is further reshaped to ensure that each image is flattened into a single-dimensional array. The process of reshaping is essential in order to ensure conformity with the input specifications of numerous machine learning models. These models typically anticipate each sample to be representing a flat array of attributes.
-"""
-
-preprocessed_images = [cv2.resize(image, (28, 28)) for image in handwritten_images]
-preprocessed_images = np.array(preprocessed_images).reshape(len(preprocessed_images), -1)
-
-"""In the present script, the trained model is employed to make predictions on digits based on preprocessed images that have undergone resizing and flattening. Following that, the photos are shown in a grid format, accompanied by their corresponding predicted digits. The grid has a fixed configuration with five columns, with the number of rows being calculated by dividing the total number of photos by the column count. I created a subplot for each image and its accompanying prediction.
-
-I labeled the image with the expected digit and make sure that the visualisation is not cluttered by any axis information. In order to maintain a tidy display, any superfluous subplots lacking photos are rendered inconspicuous. This configuration enables the user to visually validate the model's predictions by comparing them with the actual photos, hence facilitating a straightforward and unambiguous evaluation of the model's efficiency.
-"""
-
-predicted_digits = model.predict(preprocessed_images)
-
-# Display the predicted digits along with the images
-num_images = len(handwritten_images)
-num_cols = 5  # Define the number of columns
-num_rows = (num_images + 1) // num_cols
-
-fig, axes = plt.subplots(num_rows, num_cols, figsize=(10, 5 * num_rows))
-
-for i, (image, digit) in enumerate(zip(handwritten_images, predicted_digits)):
-    if i < num_images:  # Ensure not to exceed the number of images
-        row_idx = i // num_cols
-        col_idx = i % num_cols
-        axes[row_idx, col_idx].imshow(image, cmap='gray')
-        axes[row_idx, col_idx].set_title(f'Predicted Digit: {digit}')
-        axes[row_idx, col_idx].axis('off')
-    else:  # If there are extra subplots, hide them
-        axes.flat[i].set_visible(False)
-
-plt.tight_layout()
-plt.show()
-
-print(y_train.dtype)
-print(y_train.dtype)
-
-"""I begin by importing the required libraries in this code sample, which include pandas, NumPy, and TensorFlow components for data processing and model construction. I next make sure TensorFlow is compatible with our label arrays by checking the data types of y_train and y_test and converting categorical labels to integer codes.
-
-After that, I prepared the X_train and X_test feature arrays by reshaping them to match the input specifications of our convolutional neural network (CNN) and turning them to float32 numpy arrays. I build the CNN using a set of layers specifically intended for picture recognition, combine it with the proper optimizer and loss function, and then train it using the data that has been processed. In order to enable reuse of the trained model without the need for retraining, I lastly save it to a file. For picture classification problems, this method is simple and efficient.
-"""
-
-import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from tensorflow.keras import layers, models
-
-# Assuming X and y have already been loaded, split, and preprocessed
-
-# Check data types of labels and convert if necessary
-print("Initial dtype of y_train:", y_train.dtype)
-print("Initial dtype of y_test:", y_test.dtype)
-
-# Convert categorical labels to integers
-y_train = y_train.cat.codes
-y_test = y_test.cat.codes
-
-# Ensure the features are float32 arrays for TensorFlow
-X_train = np.asarray(X_train).astype('float32')
-X_test = np.asarray(X_test).astype('float32')
-
-# Reshape data for CNN if not already reshaped in preprocessing
-X_train = X_train.reshape((-1, 28, 28, 1))
-X_test = X_test.reshape((-1, 28, 28, 1))
-
-# Define the CNN model
-model = models.Sequential([
-    layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
-    layers.MaxPooling2D((2, 2)),
-    layers.Flatten(),
-    layers.Dense(128, activation='relu'),
-    layers.Dense(10, activation='softmax')  # Ensure this matches the number of categories
-])
-
-# Compile the model
-model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
-
-# Train the model
-model.fit(X_train, y_train, epochs=10, validation_data=(X_test, y_test))
-
-# Save the model
-model.save('my_mnist_model.h5')
-
-model_path = 'my_mnist_model.h5'
-model.save(model_path)
-
-from tensorflow.keras.models import load_model
-
-# Load the model from the saved file
-deployed_model = load_model(model_path)
-
-"""
-In this code snippet, I loaded an image from a specified path and converted it to grayscale using OpenCV. Then, I applied Gaussian thresholding to create a binary image where the pixels were either black or white, aiding in distinguishing objects from the background. I identified and sorted the contours of the objects in the image based on their horizontal position. For each contour, I drew a green bounding box on the original image and extracted the portion within the box. This extracted image was resized to 28x28 pixels, a common size for input into image processing models. These resized images were collected into a list. Finally, I displayed the original image with the drawn bounding boxes using OpenCV's display function, allowing for visual verification of the extraction and bounding process."""
-
-image = cv2.imread('/content/drive/MyDrive/MachineLearning-Multiple/010.png')
-# grayscale image
-gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-# Gaussian thresholding
-_, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV)
-
-# Find contours
-contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-contours = sorted(contours, key=lambda x: cv2.boundingRect(x)[0])
-cut_images = []
-
-for contour in contours:
-    x, y, width, height = cv2.boundingRect(contour)
-
-    # Draw bounding box in original picture
-    cv2.rectangle(image, (x, y), (x + width , y + height ), (0, 255, 0), 2)
-
-    # Cut and save image contain number
-    extracted_digit = gray[y:y+height, x:x+width]
-    resized_digit = cv2.resize(extracted_digit, (28, 28))
-    cut_images.append(resized_digit)
-
-cv2_imshow(image)
-
-"""This section of the code is used for predicting the digits present in images that have been extracted and preprocessed in earlier steps. Each digit image, which has been cut and resized from a larger image, is individually processed to predict which digit it represents using a pre-trained neural network model. This allows for an automated and quick interpretation of numerical data from images, which can be essential in applications such as digit recognition in scanned documents or number plate recognition systems.
-
-The loop functions by cycling through each processed digit image, reshaping and feeding it into the neural network to obtain a prediction for the digit it contains. After predicting, the loop displays each image alongside the predicted digit, providing a visual representation of the model's accuracy and effectiveness. This repetitive process ensures that each digit is evaluated, making the system efficient in handling multiple digit predictions in a sequence.
-"""
-
-# predict of digits in the above image
-for i, digit_image in enumerate(cut_images):
-    testX = digit_image.reshape((1, 28, 28, 1))
-    predictions = deployed_model.predict(testX)
-    predicted_labels = np.argmax(predictions, axis=1)
-    cv2_imshow(digit_image)
-    print(predicted_labels)
-
-"""In this code snippet, I enhanced the process of digit extraction from an image by adding padding around each digit to better center them within their bounding boxes. I converted the image to grayscale, applied Gaussian thresholding with Otsu's method for clear separation, and sorted the contours. I then adjusted the bounding boxes to include extra padding, resized each extracted digit to 28x28 pixels, and displayed the image with green bounding boxes to confirm the modifications visually. This additional padding aimed to improve the consistency and accuracy of the inputs for machine learning predictions."""
-
-image = cv2.imread('/content/drive/MyDrive/MachineLearning-Multiple/011.png')
-gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-# Gaussian thresholding
-_, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-
-# Find contours
-contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-contours = sorted(contours, key=lambda x: cv2.boundingRect(x)[0])
-
-# add padding to cut image contain number
-# so the number can be more in center
-c = 20
-cut_images= []
-
-for contour in contours:
-
-    x, y, w, h = cv2.boundingRect(contour)
-
-    # Draw bounding box in original picture
-    cv2.rectangle(image, (x-c, y-c), (x + w + c, y + h + c), (0, 255, 0), 2)
-
-    digits = gray[y-c:y+h+c, x-c:x+w+c]
-    resized_digit = cv2.resize(digits, (28, 28))
-    cut_images.append(resized_digit)
-
-cv2_imshow(image)
-
-"""In this code snippet, I processed each digit image to enhance clarity before prediction. I inverted the colors for better contrast and applied dilation to make the digits clearer. Each image was reshaped for the neural network, and predictions were made for the most likely digit. The processed images were displayed alongside their predicted labels for visual verification of the model's accuracy."""
-
-for i, box in enumerate(cut_images):
-    # convert black and white
-    box = 255 - box
-
-    # dilation so the number is more clear
-    kernel = np.ones((2, 2), np.uint8)
-    box = cv2.dilate(box, kernel, iterations=1)
-
-    testX = box.reshape((1, 28, 28, 1))
-    predictions = model.predict(testX)
-    predicted_labels = np.argmax(predictions, axis=1)
-    cv2_imshow(box)
-    print(predicted_labels)
-
-"""This code extracts and classifies individual digits according to their closeness by loading and processing an image. To decrease noise, I first loaded the image, converted it to grayscale, and then applied Gaussian blur. I created a binary image using thresholding to distinguish the numbers from the backdrop. I looped through each contour to find the bounding box for each digit after recognising and classifying the contours according to their horizontal positions.
-
-I determined the Euclidean distance between the centres of each digit's bounding boxes to see if it was close to the preceding one during the loop. I labelled the digit as near if the distance fell under a set threshold; if not, it was deemed isolated. To verify that every digit was captured, I added padding to each extraction and drew extended bounding boxes around the numbers for clarity. To ensure uniformity, every extracted digit was scaled to 28 by 28 pixels.
-
-After processing each digit, I finally changed the previous bounding box's position to the current one. To visually verify that the digit extraction and proximity categorization were accurate, the corrected image with the bounding boxes drawn was shown. When handling images with closely spaced or clustered digits, this method is very helpful since it enables focused processing and analysis for tasks like data input automation and digit recognition.
-"""
-
-import math
-from google.colab.patches import cv2_imshow
-
-# Load image
-image_path = '/content/drive/MyDrive/MachineLearning-Multiple/012.png'
-image = cv2.imread(image_path)
-
-# Convert image to grayscale
-gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-# Reduce noise
-blurred = cv2.GaussianBlur(gray, (25, 25), 0)
-
-# Thresholding to get binary image
-_, binary_image = cv2.threshold(blurred, 127, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-
-# Find contours
-contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-contours = sorted(contours, key=lambda x: cv2.boundingRect(x)[0])
-
-# Initialize lists
-cut_digits = []
-is_near = []
-previous_x = 0
-previous_y = 0
-previous_width = 0
-previous_height = 0
-
-# Padding and distance threshold
-padding = 100
-distance_threshold = 1000
-
-# Loop through contours
-for contour in contours:
-    x, y, width, height = cv2.boundingRect(contour)
-
-    # Check if the current digit is near the previous one
-    if math.sqrt(((x + width/2 - previous_x - previous_width/2)**2 + (y + height/2 - previous_y - previous_height/2)**2)) <= distance_threshold:
-        is_near.append(1)
+    search = search_svc(X_train, y_train, param_grid=param_grid, n_pca=args.n_pca,
+                        factor=args.factor, cv=args.cv, n_jobs=args.n_jobs,
+                        cache_dir=args.cache_dir)
+    print_search_report(search)
+
+    labels, _ = predict_digits(X_test, search.best_estimator_)
+    print(f"Accuracy on Test Data: {(labels == y_test).mean():.4f}")
+
+    joblib.dump(search.best_estimator_, args.output)
+    print(f"Saved best model to {args.output}")
+
+
+def build_cnn(arch):
+    """Build and compile one of the two CNN architectures from the notebook."""
+    from tensorflow.keras import layers, models
+
+    if arch == 'small':
+        model = models.Sequential([
+            layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
+            layers.MaxPooling2D((2, 2)),
+            layers.Flatten(),
+            layers.Dense(128, activation='relu'),
+            layers.Dense(10, activation='softmax')
+        ])
     else:
-        is_near.append(0)
-
-    # Draw bounding box
-    cv2.rectangle(image, (x - padding, y - padding), (x + width + padding, y + height + padding), (0, 255, 0), 2)
-
-    # Extract digit
-    digit = binary_image[y - padding:y + height + padding, x - padding:x + width + padding]
-    resized_digit = cv2.resize(digit, (28, 28))
-    cut_digits.append(resized_digit)
-
-    # Update previous box
-    previous_x, previous_y, previous_width, previous_height = x, y, width, height
-
-# Display image
-cv2_imshow(image)
-
-"""I analysed a sequence of digit pictures for prediction in this snippet of code. I began by setting up a list to hold the projected labels. I resized each digit's image to fit the neural network's specifications, and then I used the deployed_model to get predictions. Using np.argmax, I was able to extract the most likely digit from the model's output and show each digit's image for visual confirmation. Every anticipated label was appended to the roster. I printed the assembled list of predictions after processing every picture so I could check how well the model identified the digits."""
-
-# Initialize list to store predictions
-predictions_list = []
-
-# Loop through cut images
-for i, digit_box in enumerate(cut_digits):
-    # Reshape digit box for prediction
-    test_image = digit_box.reshape((1, 28, 28, 1))
-
-    # Get predictions from the model
-    predictions = deployed_model.predict(test_image)
-
-    # Get predicted label
-    predicted_label = np.argmax(predictions, axis=1)
-
-    # Display digit box
-    cv2_imshow(digit_box)
-
-    # Append predicted label to output list
-    predictions_list.append(predicted_label[0])
-
-# Print final outputs
-print("Predictions List:", predictions_list)
-
-"""This code snippet shows how I built up and trained a convolutional neural network (CNN) with TensorFlow on the MNIST dataset. To prepare the photos for neural network training, I started by loading the dataset and reshaping and normalising them. After that, I divided the training set into two halves so that I could assess how well the model performed during training. The sparse categorical crossentropy loss and Adam optimizer were used in the construction of the CNN architecture, which featured layers for feature extraction and classification. I saved the model to a file and reloaded it to ensure its integrity after training the model for ten epochs using the training and validation data. This procedure guarantees that the model is prepared for next forecasts and analyses."""
-
-import tensorflow as tf
-from tensorflow.keras.datasets import mnist
-
-# Load MNIST dataset
-(X_train, y_train), (X_test, y_test) = mnist.load_data()
-
-# Preprocess data
-X_train = X_train.reshape((X_train.shape[0], 28, 28, 1)).astype('float32') / 255
-X_test = X_test.reshape((X_test.shape[0], 28, 28, 1)).astype('float32') / 255
-
-# Split training data into training and validation sets
-val_split = 0.2
-val_size = int(len(X_train) * val_split)
-
-X_val = X_train[-val_size:]
-y_val = y_train[-val_size:]
-
-X_train = X_train[:-val_size]
-y_train = y_train[:-val_size]
-
-# Define model architecture
-model = tf.keras.Sequential([
-    tf.keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
-    tf.keras.layers.MaxPooling2D((2, 2)),
-    tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
-    tf.keras.layers.MaxPooling2D((2, 2)),
-    tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
-    tf.keras.layers.Flatten(),
-    tf.keras.layers.Dense(64, activation='relu'),
-    tf.keras.layers.Dense(10, activation='softmax')
-])
-
-# Compile model
-model.compile(optimizer='adam',
-              loss='sparse_categorical_crossentropy',
-              metrics=['accuracy'])
-
-# Train model
-model.fit(X_train, y_train, epochs=10, validation_data=(X_val, y_val))
-
-# Save model
-model.save('my_model2.h5')
-
-# Load model
-loaded_model = tf.keras.models.load_model('my_model2.h5')
-
-"""I manipulated an image to improve the accuracy of digit identification in this snippet of code. To make a binary image, I loaded the picture, turned it to grayscale, and then used Otsu's thresholding. In order to further enhance the image, I used a 3 × 5 kernel for erosion, which helps to separate related digits by making them thinner and reduce noise. To visually assess how well these adjustments prepared the image for more precise digit recognition, I presented the processed image."""
-
-image = cv2.imread('/content/drive/MyDrive/MachineLearning-Multiple/013.png')
-
-gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-_, binary_image  = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-
-# Erosion so predict digit can be more accuracy
-kernel = np.ones((3,5), np.uint8)
-image2 = cv2.erode(binary_image, kernel, iterations=1)
-#image2 = cv2.dilate(image2, kernel, iterations=1)
-cv2_imshow(image2)
-
-"""I began with an image, extracted the digit shapes, sorted them, then added padding to make sure the encapsulation was complete. After resizing each extracted digit to 28 by 28 pixels, the Euclidean distance was used to determine how close it was to the preceding digit. In order to verify precise segmentation and get the digits ready for recognition tasks, I presented the processed image with bounding boxes."""
-
-# Find contours
-contours, _ = cv2.findContours(image2, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-contours = sorted(contours, key=lambda x: cv2.boundingRect(x)[0])
-
-is_near = []
-cut_images = []
-
-pre_x = 0
-pre_y = 0
-pre_w = 0
-pre_h = 0
-
-# Adapt parameters
-c = 10
-d = 80
-
-for contour in contours:
-
-    x, y, w, h = cv2.boundingRect(contour)
-    if math.sqrt((((x + w/2) - (pre_x + pre_w/2))**2 + ((y + h/2) - (pre_y + pre_h/2))**2)) <= d:
-      is_near.append(1)
+        model = models.Sequential([
+            layers.Conv2D(32, (3, 3), activation='relu', input_shape=(28, 28, 1)),
+            layers.MaxPooling2D((2, 2)),
+            layers.Conv2D(64, (3, 3), activation='relu'),
+            layers.MaxPooling2D((2, 2)),
+            layers.Conv2D(64, (3, 3), activation='relu'),
+            layers.Flatten(),
+            layers.Dense(64, activation='relu'),
+            layers.Dense(10, activation='softmax')
+        ])
+
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def load_cnn_data(arch):
+    """Return (X_train, y_train), (X_val, y_val), pixel_scale for a CNN architecture.
+
+    The images stay uint8; pixel_scale is applied per batch by the input
+    pipeline. The small CNN is trained on raw 0-255 pixels with the same 70/30
+    split as the SVC. The deep CNN uses the standard 60k/10k MNIST split,
+    pixels scaled to [0, 1] and the last 20% of the training set for
+    validation.
+    """
+    from mnist_data import load_mnist, train_test_views
+
+    if arch == 'small':
+        X_train, X_test, y_train, y_test = load_svc_split()
+        return (X_train, y_train), (X_test, y_test), 1.0
+
+    (X_train, y_train), _ = train_test_views(*load_mnist())
+
+    # Split training data into training and validation sets
+    val_size = int(len(X_train) * 0.2)
+    X_val, y_val = X_train[-val_size:], y_train[-val_size:]
+    X_train, y_train = X_train[:-val_size], y_train[:-val_size]
+    return (X_train, y_train), (X_val, y_val), 1 / 255
+
+
+def cnn_test_data(model):
+    """Return the (X_test, y_test) digits a trained CNN has not seen, as it expects them.
+
+    The architecture is told apart by its number of convolutions: the small
+    CNN is tested on the SVC split in raw pixels, the deep CNN on the standard
+    10k MNIST test set scaled to [0, 1].
+    """
+    import numpy as np
+
+    from mnist_data import load_mnist, train_test_views
+
+    # Keras layers and NumpyCNN layer specs both name their type
+    layer_types = [layer['type'] if isinstance(layer, dict) else type(layer).__name__
+                   for layer in model.layers]
+    if layer_types.count('Conv2D') == 1:
+        _, X_test, _, y_test = load_svc_split()
+        return X_test, y_test
+
+    _, (X_test, y_test) = train_test_views(*load_mnist())
+    return X_test / np.float32(255), y_test
+
+
+def train_cnn(args):
+    """Train one of the CNNs, save it and export its weights for NumPy inference."""
+    import numpy as np
+    from tensorflow.keras.models import load_model
+
+    from numpy_cnn import NumpyCNN, compare_with_keras, export_npz
+    from tf_pipeline import make_dataset
+
+    (X_train, y_train), (X_val, y_val), scale = load_cnn_data(args.arch)
+    train_data = make_dataset(X_train, y_train, batch_size=args.batch_size, scale=scale,
+                              augment=args.augment)
+    val_data = make_dataset(X_val, y_val, batch_size=args.batch_size, scale=scale,
+                            shuffle=False)
+
+    model = build_cnn(args.arch)
+    model.fit(train_data, epochs=args.epochs, validation_data=val_data)
+    model.save(args.output)
+
+    # Reload the saved model to check its integrity before exporting it
+    deployed_model = load_model(args.output)
+    print(f"Saved CNN to {args.output}")
+
+    if args.export_npz:
+        # A flat .npz lets digits be classified later with NumPy only
+        export_npz(deployed_model, args.export_npz)
+        numpy_model = NumpyCNN.load(args.export_npz)
+        sample = np.asarray(X_val[:1000], dtype=np.float32).reshape(-1, 28, 28, 1) * scale
+        max_difference, agreement = compare_with_keras(deployed_model, numpy_model, sample)
+        print(f"Exported to {args.export_npz}: max probability difference "
+              f"{max_difference:.2e}, label agreement {agreement:.2%}")
+
+
+def predict(args):
+    """Predict single-digit images given as files or folders."""
+    import os
+
+    import cv2
+    import numpy as np
+
+    from image_loader import iter_image_batches, load_digit_image
+    from inference import load_model, predict_digits
+
+    model = load_model(args.model)
+
+    def batches():
+        files = []
+        for path in args.inputs:
+            if os.path.isdir(path):
+                yield from iter_image_batches(path, batch_size=args.batch_size,
+                                              recursive=args.recursive)
+            else:
+                files.append(path)
+        images = [load_digit_image(path) for path in files]
+        files = [path for path, image in zip(files, images) if image is not None]
+        if files:
+            yield files, np.stack([image for image in images if image is not None])
+
+    shown_images, shown_labels = [], []
+    for paths, images in batches():
+        if args.invert:
+            images = 255 - images
+        if args.dilate:
+            kernel = np.ones((2, 2), np.uint8)
+            images = np.stack([cv2.dilate(image, kernel, iterations=1) for image in images])
+
+        labels, probabilities = predict_digits(images, model, batch_size=args.batch_size)
+        for path, label, row in zip(paths, labels, probabilities):
+            print(f"{path}\t{label}\t{row.max():.3f}")
+
+        if args.plot:
+            shown_images.extend(images)
+            shown_labels.extend(labels)
+
+    if args.plot:
+        show_predictions(shown_images, shown_labels)
+
+
+def segment_settings(args, tile_workers=None):
+    """Build the recognize_page settings and optional tiled segmenter from the arguments."""
+    settings = dict(SEGMENT_PRESETS[args.preset])
+    for name in ('threshold', 'padding', 'crop_from'):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    if settings['threshold'] != 'otsu':
+        settings['threshold'] = int(settings['threshold'])
+
+    segmenter = None
+    if args.tile_size:
+        from functools import partial
+
+        from tiling import segment_tiled
+
+        segmenter = partial(segment_tiled, tile_size=args.tile_size, overlap=args.tile_overlap,
+                            roi_scale=None if args.no_roi else 0.125,
+                            workers=tile_workers or args.workers)
+    return settings, segmenter
+
+
+def segment(args):
+    """Cut every digit out of multi-digit pages and optionally predict them."""
+    import os
+
+    import cv2
+    import numpy as np
+
+    from inference import recognize_page
+    from profiling import stage
+    from grouping import group_digits, numbers_as_text
+    from segmentation import draw_boxes
+
+    settings, segmenter = segment_settings(args)
+    if segmenter is not None:
+        # Shapes larger than the tile overlap are segmented differently, so
+        # the tiling is part of the cache key
+        settings['tiling'] = {name: value for name, value in segmenter.keywords.items()
+                              if name != 'workers'}
+
+    model = None
+    model_fingerprint = ''
+    if args.model:
+        from inference import load_model
+        model = load_model(args.model)
+
+    cache = None
+    if args.cache_dir:
+        from result_cache import ResultCache, cache_key, fingerprint_model
+
+        cache = ResultCache(disk_dir=args.cache_dir, max_disk_bytes=args.cache_max_mb << 20)
+        if args.model:
+            model_fingerprint = fingerprint_model(args.model)
+
+    def decode(image_bytes):
+        with stage('imdecode', size=len(image_bytes), items=1):
+            return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    pool = None
+    tile_workers = (segmenter.keywords['workers'] or os.cpu_count() or 1) if segmenter else 1
+    if tile_workers > 1 and len(args.pages) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+
+        # One pool for all pages instead of a new one per page
+        pool = ProcessPoolExecutor(max_workers=tile_workers)
+        segmenter = partial(segmenter, executor=pool)
+
+    try:
+        for path in args.pages:
+            with stage('imread', items=1) as record:
+                with open(path, 'rb') as f:
+                    image_bytes = f.read()
+                record.size = len(image_bytes)
+
+            # The key only needs the file bytes, so a cache hit skips decoding
+            key = result = image = None
+            if cache is not None:
+                key = cache_key(image_bytes, settings, model_fingerprint)
+                result = cache.get(key)
+
+            if result is None:
+                image = decode(image_bytes)
+                if image is None:
+                    print(f"{path}: cannot read image", file=sys.stderr)
+                    continue
+                with stage('cvtColor', size=image.nbytes, items=1):
+                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                page_settings = {name: value for name, value in settings.items()
+                                 if name != 'tiling'}
+                result = recognize_page(gray, model, batch_size=args.batch_size,
+                                        segmenter=segmenter, **page_settings)
+                if cache is not None:
+                    cache.put(key, result)
+
+            print(f"{path}: {len(result.crops)} digits")
+            print("Boxes:", result.corners.tolist())
+            if model is not None:
+                print("Predictions List:", result.digits.tolist())
+
+            # Group the digits into numbers and lines, scaled to the glyph size
+            lines = group_digits(result.boxes, result.digits if model is not None else None,
+                                 line_tolerance=args.line_tolerance, number_gap=args.number_gap)
+            if model is not None:
+                print("Numbers:", numbers_as_text(lines))
+            else:
+                print("Numbers:", [[number.indices for number in line.numbers] for line in lines])
+
+            if args.output_dir:
+                # Save the page with green bounding boxes to check the segmentation visually
+                os.makedirs(args.output_dir, exist_ok=True)
+                name = os.path.splitext(os.path.basename(path))[0]
+                if image is None:
+                    image = decode(image_bytes)
+                cv2.imwrite(os.path.join(args.output_dir, f'{name}_boxes.png'),
+                            draw_boxes(image, result.corners))
+                for i, crop in enumerate(result.crops):
+                    cv2.imwrite(os.path.join(args.output_dir, f'{name}_digit{i:03d}.png'), crop)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def batch(args):
+    """Recognise every page under a folder, resumably, into a JSONL file."""
+    from batch_ocr import run_batch
+
+    # The job already runs one page per process, so tiles are segmented inline
+    settings, segmenter = segment_settings(args, tile_workers=1)
+    counts = run_batch(args.root, args.output, model_path=args.model, settings=settings,
+                       segmenter=segmenter, workers=args.workers,
+                       checkpoint_every=args.checkpoint_every, retry_errors=args.retry_errors,
+                       batch_size=args.batch_size)
+    print(f"{counts['processed']} pages processed, {counts['failed']} failed, "
+          f"{counts['skipped']} already done; results in {args.output}")
+
+
+def cascade(args):
+    """Calibrate a cascade of models on held-out digits and report its escalation rate."""
+    import json
+
+    from cascade import CascadeClassifier, evaluate_cascade
+    from inference import load_model
+
+    # Half of the SVC / small CNN test split calibrates, the other half evaluates
+    _, X_test, _, y_test = load_svc_split()
+    if args.limit:
+        X_test, y_test = X_test[:args.limit], y_test[:args.limit]
+    half = len(X_test) // 2
+    X_val, y_val, X_eval, y_eval = X_test[:half], y_test[:half], X_test[half:], y_test[half:]
+
+    model = CascadeClassifier([load_model(path) for path in args.stages],
+                              measure=args.confidence, stage_paths=args.stages)
+    thresholds = model.calibrate(X_val, y_val, tolerance=args.tolerance,
+                                 batch_size=args.batch_size)
+    print("Thresholds:", [round(value, 4) for value in thresholds])
+
+    report = evaluate_cascade(model, X_eval, y_eval, batch_size=args.batch_size)
+    print(f"{'Model':<28}{'Accuracy':>10}{'Digits/s':>12}")
+    for stage_report in report['stages']:
+        print(f"{stage_report['path']:<28}{stage_report['accuracy']:>10.4f}"
+              f"{stage_report['digits_per_second']:>12.0f}")
+    summary = report['cascade']
+    print(f"{'cascade':<28}{summary['accuracy']:>10.4f}{summary['digits_per_second']:>12.0f}")
+    print(f"Escalation rate: {summary['escalation_rate']:.2%} "
+          f"(digits answered per stage: {summary['answered_by_stage']})")
+
+    model.save(args.output)
+    print(f"Saved cascade to {args.output}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def compress(args):
+    """Write a smaller copy of a model and check its accuracy against the original."""
+    import json
+    import os
+    import tempfile
+
+    from compression import verify_artifact
+    from inference import load_model
+
+    original = load_model(args.model)
+    if args.model.endswith(('.npz', '.h5', '.keras')):
+        from numpy_cnn import export_npz, quantize_npz
+
+        X_test, y_test = cnn_test_data(original)
+
+        output = args.output or os.path.splitext(args.model)[0] + '_int8.npz'
+        if args.model.endswith('.npz'):
+            quantize_npz(args.model, output)
+        else:
+            # Keras models go through the NumPy export first
+            with tempfile.TemporaryDirectory() as folder:
+                exported = export_npz(original, os.path.join(folder, 'model.npz'))
+                quantize_npz(exported, output)
     else:
-      is_near.append(0)
-
-    # Draw bounding box
-    cv2.rectangle(image, (x-c, y-c), (x + w + c, y + h + c), (0, 255, 0), 2)
-
-    # Cắt và lưu ảnh chứa chữ số
-    digit = image2[y-c:y+h+c, x-c:x+w+c]
-    resized_digit = cv2.resize(digit, (28, 28))
-    cut_images.append(resized_digit)
-
-    pre_x,pre_y,pre_w,pre_h = x,y,w,h
-
-cv2_imshow(image)
-
-"""I looped over a series of digit images in this snippet of code, altering each to make it compatible with a neural network model that was already loaded. I identified the digit I thought would appear in each picture, showed it for visual verification, and saved the estimated label in an output list. In order to make sure every processed number was correctly identified, I printed the list at the end and went over all of the model's predictions."""
-
-output = []
-for i, box in enumerate(cut_images):
-    testX = box.reshape((1, 28, 28, 1))
-    predictions = loaded_model.predict(testX)
-    predicted_labels = np.argmax(predictions, axis=1)
-    cv2_imshow(box)
-    output.append(predicted_labels[0])
-
-print(output)
-
+        import joblib
+
+        from compression import compress_svc
+
+        X_train, X_test, _, y_test = load_svc_split()
+        output = args.output or os.path.splitext(args.model)[0] + '_compact.joblib'
+        # A reduced model is refitted on training digits, not only on the
+        # support vectors it is reduced from
+        compact = compress_svc(original, keep=args.keep,
+                               reference=X_train if args.keep < 1.0 else None)
+        joblib.dump(compact, output)
+        print(f"Support vectors: {compact.n_support} ({compact.support_vectors.dtype})")
+
+    if args.limit:
+        X_test, y_test = X_test[:args.limit], y_test[:args.limit]
+    report = verify_artifact(original, load_model(output), X_test, y_test,
+                             batch_size=args.batch_size, original_path=args.model,
+                             compressed_path=output)
+
+    print(f"{'Model':<12}{'Size (MB)':>11}{'Load (s)':>10}{'Accuracy':>10}{'Digits/s':>11}")
+    for name in ('original', 'compressed'):
+        entry = report[name]
+        print(f"{name:<12}{entry['bytes'] / 2 ** 20:>11.2f}{entry['load_seconds']:>10.3f}"
+              f"{entry['accuracy']:>10.4f}{entry['digits_per_second']:>11.0f}")
+    print(f"Label agreement: {report['agreement']:.2%}")
+    print(f"Saved compressed model to {output}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def bench(args):
+    """Run the benchmark suite and write the results as JSON."""
+    import json
+
+    from benchmark import run_benchmarks, write_report
+
+    report = run_benchmarks(
+        stages=args.stages.split(','), data_source=args.data, n_train=args.train_size,
+        n_test=args.test_size, model_path=args.model,
+        batch_sizes=[int(size) for size in args.batch_sizes.split(',')],
+        repeat=args.repeat, cnn_epochs=args.epochs, num_pages=args.pages, seed=args.seed)
+
+    if args.output:
+        write_report(report, args.output)
+        print(f"Saved benchmark results to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+def svc_gamma(value):
+    # search-svc takes a comma-separated list instead and parses it itself
+    return value if value in ('scale', 'auto') else float(value)
+
+
+def add_fast_svm_arguments(parser):
+    parser.add_argument('--n-pca', type=int, default=50, help="PCA components for the fast SVM")
+    parser.add_argument('--n-components', type=int, default=2000,
+                        help="kernel approximation components for the fast SVM")
+    parser.add_argument('--kernel-approx', choices=['nystroem', 'rff'], default='nystroem')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Handwritten digit recognition on MNIST.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('train-svc', help="train the RBF SVC")
+    p.add_argument('--output', default='svc_model.joblib')
+    p.add_argument('--C', type=float, default=1.0)
+    p.add_argument('--gamma', type=svc_gamma, default='scale', help="'scale', 'auto' or a number")
+    p.add_argument('--max-iter', type=int, default=10000)
+    p.add_argument('--fast', action='store_true', help="also train and compare the fast SVM")
+    p.add_argument('--fast-output', help="also train the fast SVM and save it here")
+    p.add_argument('--plot', action='store_true', help="show predictions for 10 test images")
+    add_fast_svm_arguments(p)
+    p.set_defaults(func=train_svc)
+
+    p = subparsers.add_parser('search-svc', help="tune the SVC with successive halving")
+    p.add_argument('--output', default='svc_search_model.joblib')
+    p.add_argument('--train-size', type=int, help="search on only this many samples")
+    p.add_argument('--C', help="comma-separated C values")
+    p.add_argument('--gamma', help="comma-separated gamma values ('scale' allowed)")
+    p.add_argument('--n-pca', type=int, default=50)
+    p.add_argument('--factor', type=int, default=3, help="keep 1/factor candidates per round")
+    p.add_argument('--cv', type=int, default=3)
+    p.add_argument('--n-jobs', type=int, default=-1, help="worker processes (-1 for all CPUs)")
+    p.add_argument('--cache-dir', help="keep the cached PCA features in this folder")
+    p.set_defaults(func=search_svc)
+
+    p = subparsers.add_parser('cascade', help="combine models into a confidence cascade")
+    p.add_argument('stages', nargs='+',
+                   help="model files from cheapest to most expensive, e.g. a fast SVM and the SVC")
+    p.add_argument('--output', default='cascade.json', help="cascade file, usable as --model")
+    p.add_argument('--confidence', choices=['margin', 'max'], default='margin',
+                   help="top-1 minus top-2 probability, or top-1 probability")
+    p.add_argument('--tolerance', type=float, default=0.0,
+                   help="accuracy each stage may lose on the validation half, e.g. 0.001")
+    p.add_argument('--limit', type=int, help="use only this many held-out digits")
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--report', help="also write the evaluation as JSON to this file")
+    p.set_defaults(func=cascade)
+
+    p = subparsers.add_parser('compress', help="write a smaller, faster copy of a model")
+    p.add_argument('model', help=".npz/.h5/.keras CNN (int8 weights) or .joblib RBF SVC")
+    p.add_argument('--output', help="defaults to <model>_int8.npz or <model>_compact.joblib")
+    p.add_argument('--keep', type=float, default=1.0,
+                   help="fraction of SVC support vectors to keep (refitted when below 1)")
+    p.add_argument('--limit', type=int, default=5000,
+                   help="held-out digits used to check the accuracy (0 for all)")
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--report', help="also write the comparison as JSON to this file")
+    p.set_defaults(func=compress)
+
+    p = subparsers.add_parser('train-cnn', help="train one of the CNNs")
+    p.add_argument('--arch', choices=['small', 'deep'], default='small')
+    p.add_argument('--epochs', type=int, default=10)
+    p.add_argument('--output', help="defaults to my_mnist_model.h5 (small) or my_model2.h5 (deep)")
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--augment', action='store_true',
+                   help="randomly shift, rotate and dilate the training digits")
+    p.add_argument('--export-npz', help="also export the weights to this .npz file")
+    p.set_defaults(func=train_cnn)
+
+    p = subparsers.add_parser('predict', help="predict single-digit images")
+    p.add_argument('inputs', nargs='+', help="image files or folders of images")
+    p.add_argument('--model', required=True, help=".joblib, .h5/.keras or .npz model file")
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--recursive', action='store_true', help="also read images in subfolders")
+    p.add_argument('--invert', action='store_true', help="invert dark-on-light images")
+    p.add_argument('--dilate', action='store_true', help="thicken the strokes before predicting")
+    p.add_argument('--plot', action='store_true', help="show the images with their predictions")
+    add_profile_arguments(p)
+    p.set_defaults(func=predict)
+
+    p = subparsers.add_parser('segment', help="cut the digits out of multi-digit pages")
+    p.add_argument('pages', nargs='+', help="page image files")
+    add_segment_arguments(p)
+    p.add_argument('--number-gap', type=float, default=0.5,
+                   help="max gap between digits of one number, in median glyph widths")
+    p.add_argument('--line-tolerance', type=float, default=0.6,
+                   help="max vertical offset within a line, in median glyph heights")
+    p.add_argument('--model', help="model used to predict the cut digits")
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--output-dir', help="save annotated pages and crops here")
+    p.add_argument('--cache-dir', help="reuse results of previously processed identical pages")
+    p.add_argument('--cache-max-mb', type=int, default=1024, help="size limit of --cache-dir")
+    p.add_argument('--workers', type=int, help="processes for --tile-size (default: all CPUs)")
+    add_profile_arguments(p)
+    p.set_defaults(func=segment)
+
+    p = subparsers.add_parser('batch', help="recognise a directory tree of pages into JSONL")
+    p.add_argument('root', help="folder searched recursively for page images")
+    p.add_argument('--output', default='results.jsonl',
+                   help="JSONL results; rerunning with the same file resumes the job")
+    p.add_argument('--model', help="model used to predict the cut digits")
+    add_segment_arguments(p)
+    p.add_argument('--batch-size', type=int, default=256)
+    p.add_argument('--workers', type=int, help="worker processes (default: all CPUs)")
+    p.add_argument('--checkpoint-every', type=int, default=100,
+                   help="pages between flushes of the output file to disk")
+    p.add_argument('--retry-errors', action='store_true',
+                   help="process pages that failed in an earlier run again")
+    p.set_defaults(func=batch)
+
+    p = subparsers.add_parser('bench', help="benchmark training, segmentation and inference")
+    p.add_argument('--stages', default='svc,inference,segment',
+                   help="comma-separated subset of svc,cnn,inference,segment")
+    p.add_argument('--data', choices=['synthetic', 'mnist'], default='synthetic')
+    p.add_argument('--train-size', type=int, default=5000)
+    p.add_argument('--test-size', type=int, default=2000)
+    p.add_argument('--model', help="model for the inference stage (default: a fast SVM)")
+    p.add_argument('--batch-sizes', default='1,16,64,256')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--epochs', type=int, default=2, help="CNN epochs to time")
+    p.add_argument('--pages', type=int, default=10, help="synthetic pages to segment")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--output', help="write the JSON results here instead of printing them")
+    p.set_defaults(func=bench)
+
+    return parser
+
+
+def add_segment_arguments(parser):
+    parser.add_argument('--preset', choices=sorted(SEGMENT_PRESETS), default='eroded')
+    parser.add_argument('--threshold', help="'otsu' or a fixed threshold value")
+    parser.add_argument('--padding', type=int)
+    parser.add_argument('--crop-from', choices=['gray', 'binary'])
+    parser.add_argument('--tile-size', type=int,
+                        help="segment large scans in tiles of this size (e.g. 1024)")
+    parser.add_argument('--tile-overlap', type=int, default=128,
+                        help="overlap between tiles; should exceed the largest digit")
+    parser.add_argument('--no-roi', action='store_true',
+                        help="process every tile instead of skipping blank ones")
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', help="write per-stage timings as JSON to this file")
+    parser.add_argument('--prometheus', help="write per-stage timings in Prometheus text format")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'train-cnn' and args.output is None:
+        args.output = 'my_mnist_model.h5' if args.arch == 'small' else 'my_model2.h5'
+
+    profiler = None
+    if getattr(args, 'profile', None) or getattr(args, 'prometheus', None):
+        import profiling
+        profiler = profiling.enable()
+
+    args.func(args)
+
+    if profiler is not None:
+        if args.profile:
+            profiler.to_json(args.profile)
+        if args.prometheus:
+            profiler.to_prometheus(path=args.prometheus)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Local, memory-mapped MNIST cache.
+
+The 70,000 MNIST digits are downloaded once with fetch_openml and stored as two
+uint8 .npy files (pixels and labels). Every later run memory-maps those files,
+so the SVC and the CNN read the same zero-copy array and no network access is
+needed once the cache exists.
+"""
+
+import os
+
+import numpy as np
+
+# Folder holding the cache, override with the MNIST_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.environ.get(
+    'MNIST_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mnist_cache'))
+
+IMAGES_FILE = 'mnist_images.npy'
+LABELS_FILE = 'mnist_labels.npy'
+
+# The first 60,000 samples are the original MNIST training set, the rest the test set
+TRAIN_SIZE = 60000
+IMAGE_SHAPE = (28, 28)
+
+
+def cache_paths(cache_dir=None):
+    """Return the (images, labels) file paths inside cache_dir."""
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    return os.path.join(cache_dir, IMAGES_FILE), os.path.join(cache_dir, LABELS_FILE)
+
+
+def build_cache(cache_dir=None):
+    """Download MNIST once and write it to cache_dir as uint8 .npy files."""
+    from sklearn.datasets import fetch_openml
+
+    images_path, labels_path = cache_paths(cache_dir)
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+
+    mnist = fetch_openml('mnist_784', version=1, as_frame=False)
+    images = np.asarray(mnist['data']).astype(np.uint8)
+    labels = np.asarray(mnist['target'], dtype=np.int64).astype(np.uint8)
+
+    # Write to a temporary name first so an interrupted download never leaves
+    # a truncated file that later looks like a valid cache
+    for path, array in ((images_path, images), (labels_path, labels)):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+    return images_path, labels_path
+
+
+def load_mnist(cache_dir=None, mmap_mode='r', download=True):
+    """Load MNIST from the local cache, building it first if needed.
+
+    Returns images as a (70000, 784) uint8 array and labels as a (70000,)
+    uint8 array. With the default mmap_mode='r' both are read-only memory
+    maps, so reshaping or slicing them (e.g. images.reshape(-1, 28, 28, 1))
+    does not copy any pixels.
+    """
+    images_path, labels_path = cache_paths(cache_dir)
+
+    if not (os.path.exists(images_path) and os.path.exists(labels_path)):
+        if not download:
+            raise FileNotFoundError(
+                f"MNIST cache not found in {os.path.dirname(images_path)!r}")
+        build_cache(cache_dir)
+
+    images = np.load(images_path, mmap_mode=mmap_mode)
+    labels = np.load(labels_path, mmap_mode=mmap_mode)
+    return images, labels
+
+
+def train_test_views(images, labels, train_size=TRAIN_SIZE):
+    """Split into the standard MNIST train/test sets without copying."""
+    return (images[:train_size], labels[:train_size]), (images[train_size:], labels[train_size:])
@@ -0,0 +1,223 @@
+"""Pure-NumPy inference for the small Conv2D -> MaxPooling2D -> Dense CNNs.
+
+Importing TensorFlow and calling load_model takes seconds and hundreds of MB
+before the first prediction, which dominates short CLI runs and worker start
+up. export_npz writes the trained weights and layer settings of a Keras model
+to one flat .npz file, and NumpyCNN runs the same layers with NumPy only:
+
+    exported = export_npz(model, 'my_mnist_model.npz')   # needs TensorFlow
+    cnn = NumpyCNN.load('my_mnist_model.npz')             # NumPy only
+    probabilities = cnn.predict(images)
+
+quantize_npz stores the same file with int8 kernels, about a quarter of the
+size. NumpyCNN keeps them as int8 in memory too, which cuts the weight memory
+of every worker by the same factor, and applies the per-channel scales to the
+output of each matrix product. The products themselves still run in float32,
+since NumPy has no int8 matrix multiply, so per-digit compute is unchanged.
+
+Supported layers are Conv2D, MaxPooling2D, Flatten, Dense and Dropout (a no-op
+at inference time) with relu, softmax or linear activations.
+"""
+
+import json
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SUPPORTED_LAYERS = ('Conv2D', 'MaxPooling2D', 'Flatten', 'Dense', 'Dropout', 'InputLayer')
+
+
+def _layer_spec(layer):
+    # Keep only the settings the NumPy engine needs from the Keras config
+    config = layer.get_config()
+    spec = {'type': type(layer).__name__}
+    if spec['type'] == 'Conv2D':
+        spec.update(strides=list(config['strides']), padding=config['padding'],
+                    activation=config['activation'])
+    elif spec['type'] == 'MaxPooling2D':
+        spec.update(pool_size=list(config['pool_size']),
+                    strides=list(config['strides'] or config['pool_size']),
+                    padding=config['padding'])
+    elif spec['type'] == 'Dense':
+        spec.update(activation=config['activation'])
+    return spec
+
+
+def export_npz(model, path):
+    """Write a Keras model's architecture and float32 weights to a flat .npz file."""
+    arrays = {}
+    layers = []
+    for i, layer in enumerate(model.layers):
+        spec = _layer_spec(layer)
+        if spec['type'] not in SUPPORTED_LAYERS:
+            raise ValueError(f"layer {layer.name!r} of type {spec['type']} is not supported")
+        if spec['type'] == 'InputLayer':
+            continue
+
+        weights = layer.get_weights()
+        if weights:
+            kernel = weights[0].astype(np.float32)
+            bias = weights[1] if len(weights) > 1 else np.zeros(kernel.shape[-1])
+            arrays[f'layer{i}_kernel'] = kernel
+            arrays[f'layer{i}_bias'] = bias.astype(np.float32)
+            spec['weights'] = f'layer{i}'
+        layers.append(spec)
+
+    architecture = {'input_shape': list(model.input_shape[1:]), 'layers': layers}
+    np.savez(path, architecture=np.array(json.dumps(architecture)), **arrays)
+    return path
+
+
+def quantize_npz(source, path):
+    """Write an int8 copy of an exported .npz model, about a quarter of its size.
+
+    Kernels are quantised symmetrically per output channel (the last axis):
+    each channel keeps its own float32 scale, so a channel with small weights
+    does not lose its precision to one with large weights. Biases stay
+    float32; they are tiny. NumpyCNN keeps the kernels as int8 and scales the
+    layer outputs instead.
+    """
+    with np.load(source, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files}
+
+    for key in [key for key in arrays if key.endswith('_kernel')]:
+        kernel = arrays[key].astype(np.float32)
+        channel_max = np.abs(kernel).reshape(-1, kernel.shape[-1]).max(axis=0)
+        scale = np.where(channel_max > 0, channel_max / 127, 1).astype(np.float32)
+        arrays[key] = np.clip(np.round(kernel / scale), -127, 127).astype(np.int8)
+        arrays[key + '_scale'] = scale
+
+    # Uncompressed, so loading stays a plain read
+    np.savez(path, **arrays)
+    return path
+
+
+def _same_padding(size, kernel, stride):
+    # Same rule as TensorFlow: pad so that out = ceil(size / stride), extra pixel at the end
+    out = -(-size // stride)
+    total = max((out - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _pad_nhwc(x, kernel_size, strides, padding, value=0.0):
+    if padding != 'same':
+        return x
+    (top, bottom), (left, right) = (_same_padding(x.shape[1], kernel_size[0], strides[0]),
+                                    _same_padding(x.shape[2], kernel_size[1], strides[1]))
+    return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=value)
+
+
+def conv2d(x, kernel, bias, strides=(1, 1), padding='valid', scale=None):
+    """2D convolution of an NHWC batch using im2col and a single matrix product.
+
+    scale: per-filter scales of an int8 kernel from quantize_npz, if any
+    """
+    kh, kw, channels, filters = kernel.shape
+    x = _pad_nhwc(x, (kh, kw), strides, padding)
+
+    # windows: (N, H_out, W_out, C, kh, kw) view of x, no copy yet
+    windows = sliding_window_view(x, (kh, kw), axis=(1, 2))[:, ::strides[0], ::strides[1]]
+    n, h_out, w_out = windows.shape[:3]
+
+    # im2col: one row per output pixel, ordered (kh, kw, C) like the Keras kernel
+    columns = windows.transpose(0, 1, 2, 4, 5, 3).reshape(n * h_out * w_out, kh * kw * channels)
+    out = columns @ kernel.reshape(kh * kw * channels, filters)
+    if scale is not None:
+        # Per-channel scales commute with the sum over the window
+        out *= scale
+    out += bias
+    return out.reshape(n, h_out, w_out, filters)
+
+
+def max_pool2d(x, pool_size=(2, 2), strides=None, padding='valid'):
+    """Max pooling of an NHWC batch."""
+    strides = tuple(strides or pool_size)
+    ph, pw = pool_size
+    x = _pad_nhwc(x, pool_size, strides, padding, value=-np.inf)
+
+    if strides == tuple(pool_size):
+        # Non-overlapping windows: crop to a multiple of the pool and reshape
+        n, h, w, c = x.shape
+        h_out, w_out = h // ph, w // pw
+        x = x[:, :h_out * ph, :w_out * pw]
+        return x.reshape(n, h_out, ph, w_out, pw, c).max(axis=(2, 4))
+
+    windows = sliding_window_view(x, (ph, pw), axis=(1, 2))[:, ::strides[0], ::strides[1]]
+    return windows.max(axis=(4, 5))
+
+
+def _activate(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0, out=x)
+    if activation == 'softmax':
+        x = x - x.max(axis=-1, keepdims=True)
+        np.exp(x, out=x)
+        x /= x.sum(axis=-1, keepdims=True)
+        return x
+    if activation == 'linear':
+        return x
+    raise ValueError(f"activation {activation!r} is not supported")
+
+
+class NumpyCNN:
+    """Run an exported CNN with NumPy only.
+
+    It has the same input_shape / predict_on_batch interface as a Keras model,
+    so it can be passed to inference.predict_digits in place of one.
+    """
+
+    def __init__(self, architecture, weights):
+        self.input_shape = (None,) + tuple(architecture['input_shape'])
+        self.layers = architecture['layers']
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            architecture = json.loads(str(data['architecture']))
+            # int8 kernels from quantize_npz stay int8, next to their _kernel_scale
+            weights = {key: data[key] for key in data.files if key != 'architecture'}
+        return cls(architecture, weights)
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=np.float32).reshape((-1,) + self.input_shape[1:])
+        for layer in self.layers:
+            kind = layer['type']
+            if kind == 'Conv2D':
+                prefix = layer['weights']
+                x = conv2d(x, self.weights[prefix + '_kernel'], self.weights[prefix + '_bias'],
+                           layer['strides'], layer['padding'],
+                           self.weights.get(prefix + '_kernel_scale'))
+                x = _activate(x, layer['activation'])
+            elif kind == 'MaxPooling2D':
+                x = max_pool2d(x, layer['pool_size'], layer['strides'], layer['padding'])
+            elif kind == 'Flatten':
+                x = x.reshape(len(x), -1)
+            elif kind == 'Dense':
+                prefix = layer['weights']
+                x = x @ self.weights[prefix + '_kernel']
+                scale = self.weights.get(prefix + '_kernel_scale')
+                if scale is not None:
+                    x *= scale
+                x += self.weights[prefix + '_bias']
+                x = _activate(x, layer['activation'])
+        return x
+
+    def predict(self, x, batch_size=256):
+        """Return the class probabilities for x, computed batch_size samples at a time."""
+        x = np.asarray(x).reshape((-1,) + self.input_shape[1:])
+        outputs = [self.predict_on_batch(x[start:start + batch_size])
+                   for start in range(0, len(x), batch_size)]
+        return np.concatenate(outputs) if outputs else np.empty((0, 0), dtype=np.float32)
+
+
+def compare_with_keras(keras_model, cnn, images, batch_size=256):
+    """Check that the NumPy engine reproduces the Keras predictions.
+
+    Returns (max_abs_difference, label_agreement) over images.
+    """
+    expected = np.asarray(keras_model.predict(np.asarray(images, dtype=np.float32), verbose=0,
+                                              batch_size=batch_size))
+    actual = cnn.predict(images, batch_size=batch_size)
+    label_agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+    return float(np.abs(expected - actual).max()), label_agreement
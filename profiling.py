@@ -0,0 +1,167 @@
+"""Per-stage instrumentation for the segmentation and prediction pipeline.
+
+Each pipeline stage (imread, cvtColor, blur, threshold, erode, connected
+components, crop/resize, predict) is wrapped in a stage() block that records
+its wall time, input size in bytes and item count:
+
+    with profiling.stage('threshold', size=gray.nbytes) as record:
+        binary = ...
+        record.items = 1
+
+Profiling is off by default. Until enable() is called, stage() returns one
+shared no-op object, so the instrumented code costs only a function call and
+an attribute check per stage. The aggregates can be exported as JSON or in
+the Prometheus text exposition format.
+"""
+
+import json
+import threading
+import time
+
+_active = None
+
+
+class StageStats:
+    """Aggregated measurements of one stage."""
+
+    __slots__ = ('calls', 'total_seconds', 'max_seconds', 'total_bytes', 'total_items')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_bytes = 0
+        self.total_items = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+            'max_seconds': self.max_seconds,
+            'total_bytes': self.total_bytes,
+            'total_items': self.total_items,
+        }
+
+
+class Profiler:
+    """Collect per-stage timings. Safe to share between threads."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, size=None, items=None):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.total_bytes += size or 0
+            stats.total_items += items or 0
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def as_dict(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.stages.items()}
+
+    def to_json(self, path=None):
+        """Return the aggregates as JSON, also writing them to path if given."""
+        text = json.dumps(self.as_dict(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix='digit_pipeline', path=None):
+        """Return the aggregates in the Prometheus text format."""
+        stages = self.as_dict()
+        metrics = (
+            ('stage_seconds', 'summary', 'Wall time spent in each pipeline stage.', None),
+            ('stage_max_seconds', 'gauge', 'Slowest single call of each stage.', 'max_seconds'),
+            ('stage_bytes_total', 'counter', 'Input bytes processed by each stage.', 'total_bytes'),
+            ('stage_items_total', 'counter', 'Items processed by each stage.', 'total_items'),
+        )
+
+        lines = []
+        for metric, kind, help_text, key in metrics:
+            name = f'{prefix}_{metric}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for stage_name, stats in sorted(stages.items()):
+                label = '{stage="%s"}' % stage_name.replace('\\', '\\\\').replace('"', '\\"')
+                if key is None:
+                    lines.append(f'{name}_sum{label} {stats["total_seconds"]!r}')
+                    lines.append(f'{name}_count{label} {stats["calls"]}')
+                else:
+                    lines.append(f'{name}{label} {stats[key]!r}')
+
+        text = '\n'.join(lines) + '\n'
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+class _StageRecord:
+    __slots__ = ('profiler', 'name', 'size', 'items', 'start')
+
+    def __init__(self, profiler, name, size, items):
+        self.profiler = profiler
+        self.name = name
+        self.size = size
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start, self.size, self.items)
+        return False
+
+
+class _NullRecord:
+    # Shared by every stage() call while profiling is disabled; assigning
+    # size or items to it is accepted and ignored
+    __slots__ = ('size', 'items')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_RECORD = _NullRecord()
+
+
+def stage(name, size=None, items=None):
+    """Context manager timing one pipeline stage on the active profiler."""
+    profiler = _active
+    if profiler is None:
+        return _NULL_RECORD
+    return _StageRecord(profiler, name, size, items)
+
+
+def enable(profiler=None):
+    """Start recording stages on profiler (a new one by default) and return it."""
+    global _active
+    _active = profiler or Profiler()
+    return _active
+
+
+def disable():
+    """Stop recording and return the profiler that was active, if any."""
+    global _active
+    profiler, _active = _active, None
+    return profiler
+
+
+def get_profiler():
+    return _active
@@ -0,0 +1,152 @@
+"""Content-addressed cache of segmentation and prediction results.
+
+Retries, duplicates and re-exports send the same page through the pipeline
+again. A result is keyed by the SHA-256 of the image bytes together with the
+pipeline settings (threshold, blur, erosion, padding, ...) and a fingerprint
+of the model files, so any change to one of them misses the cache instead of
+returning a stale result.
+
+There are two tiers: an in-memory LRU of recent pages, and an optional
+on-disk tier of .npz files that evicts the least recently used files once
+their total size exceeds max_disk_bytes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from inference import PageResult
+
+
+def fingerprint_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, used to tell model versions apart."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_model(path):
+    """Fingerprint of a model file; for a cascade, of its JSON and every stage file."""
+    fingerprint = fingerprint_file(path)
+    if path.endswith('.json'):
+        from cascade import read_config
+
+        # The JSON only names the stages, so retraining a stage in place
+        # must change the fingerprint too
+        _, stage_paths = read_config(path)
+        digest = hashlib.sha256(fingerprint.encode())
+        for stage_path in stage_paths:
+            digest.update(fingerprint_model(stage_path).encode())
+        fingerprint = digest.hexdigest()
+    return fingerprint
+
+
+def cache_key(image_bytes, settings, model_fingerprint=''):
+    """Key for one page: hash of the image bytes, pipeline settings and model."""
+    digest = hashlib.sha256(image_bytes)
+    digest.update(json.dumps(settings, sort_keys=True, default=list).encode())
+    digest.update(model_fingerprint.encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional disk) cache of PageResult objects."""
+
+    def __init__(self, max_entries=1024, disk_dir=None, max_disk_bytes=1 << 30):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(disk_dir)
+                                   if entry.name.endswith('.npz'))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.npz')
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached PageResult for key, or None."""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with np.load(path) as data:
+                    result = PageResult(*(data[field] for field in PageResult._fields))
+                # Touch the file so eviction treats it as recently used
+                os.utime(path)
+            except (OSError, KeyError, ValueError):
+                result = None
+            if result is not None:
+                self._remember(key, result)
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Store a PageResult under key in memory and, if enabled, on disk."""
+        self._remember(key, result)
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **result._asdict())
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path) - old_size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        # Remove least recently used files until the tier is back under its
+        # limit; called with the lock held
+        entries = sorted((entry for entry in os.scandir(self.disk_dir)
+                          if entry.name.endswith('.npz')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._disk_bytes -= size
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'disk_bytes': self._disk_bytes,
+        }
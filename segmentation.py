@@ -0,0 +1,143 @@
+"""Segmentation of multi-digit images into 28x28 crops.
+
+All of the multi-digit examples in the script follow the same steps: threshold
+the page, find the outer shape of every digit, sort them left to right, pad
+each bounding box and resize the crop to 28x28. segment_digits does this once
+using cv2.connectedComponentsWithStats, so the bounding boxes come back as one
+NumPy array and can be filtered, padded and clamped without a Python loop.
+"""
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from profiling import stage
+
+DIGIT_SIZE = (28, 28)
+
+# boxes: (N, 4) unpadded (x, y, w, h) boxes sorted left to right
+# corners: (N, 4) padded and clamped (x0, y0, x1, y1) corners of the same boxes
+# crops: (N, 28, 28) uint8 digit crops
+# binary: the thresholded page
+Segmentation = namedtuple('Segmentation', ['boxes', 'corners', 'crops', 'binary'])
+
+
+def binarize(gray, threshold='otsu', blur_ksize=None, erode_kernel=None):
+    """Turn a grayscale page into a binary image with white digits on black.
+
+    threshold: 'otsu' for Otsu's method, or an int for a fixed threshold
+    blur_ksize: optional (w, h) Gaussian blur kernel applied before thresholding
+    erode_kernel: optional (h, w) kernel shape used to erode the binary image
+    """
+    if blur_ksize is not None:
+        with stage('blur', size=gray.nbytes, items=1):
+            gray = cv2.GaussianBlur(gray, tuple(blur_ksize), 0)
+
+    with stage('threshold', size=gray.nbytes, items=1):
+        if threshold == 'otsu':
+            _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        else:
+            _, binary = cv2.threshold(gray, int(threshold), 255, cv2.THRESH_BINARY_INV)
+
+    if erode_kernel is not None:
+        with stage('erode', size=binary.nbytes, items=1):
+            binary = cv2.erode(binary, np.ones(tuple(erode_kernel), np.uint8), iterations=1)
+    return binary
+
+
+def fill_holes(binary):
+    """Fill the holes inside shapes (e.g. the middle of a 0, 6, 8 or 9).
+
+    Any background region that does not touch the image border is a hole.
+    Filling them means a connected component covers exactly the area of an
+    external contour, so marks inside a digit's loop are not reported as
+    separate digits.
+    """
+    height, width = binary.shape
+    background = (binary == 0).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(background, connectivity=4)
+
+    left = stats[:, cv2.CC_STAT_LEFT]
+    top = stats[:, cv2.CC_STAT_TOP]
+    right = left + stats[:, cv2.CC_STAT_WIDTH]
+    bottom = top + stats[:, cv2.CC_STAT_HEIGHT]
+    is_hole = (left > 0) & (top > 0) & (right < width) & (bottom < height)
+    is_hole[0] = False  # label 0 is the foreground here
+
+    filled = binary.copy()
+    filled[is_hole[labels]] = 255
+    return filled
+
+
+def find_boxes(binary, min_area=1, min_size=1):
+    """Return the (x, y, w, h) boxes of every shape, sorted left to right.
+
+    Shapes with fewer than min_area pixels, or narrower and shorter than
+    min_size, are treated as noise and dropped.
+    """
+    with stage('find_boxes', size=binary.nbytes) as record:
+        _, _, stats, _ = cv2.connectedComponentsWithStats(fill_holes(binary), connectivity=8)
+        stats = stats[1:]  # label 0 is the background
+
+        keep = stats[:, cv2.CC_STAT_AREA] >= min_area
+        keep &= np.maximum(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]) >= min_size
+        boxes = stats[keep, :4].astype(np.int64)
+        record.items = len(boxes)
+
+    return boxes[np.argsort(boxes[:, 0], kind='stable')]
+
+
+def pad_boxes(boxes, padding, image_shape):
+    """Grow boxes by padding pixels on every side, clamped to the image.
+
+    Returns the padded boxes as an (N, 4) array of (x0, y0, x1, y1) corners.
+    Clamping matters because slicing with a negative start such as gray[y - c:]
+    silently wraps around to the end of the image.
+    """
+    height, width = image_shape[:2]
+    corners = np.empty_like(boxes)
+    corners[:, 0] = boxes[:, 0] - padding
+    corners[:, 1] = boxes[:, 1] - padding
+    corners[:, 2] = boxes[:, 0] + boxes[:, 2] + padding
+    corners[:, 3] = boxes[:, 1] + boxes[:, 3] + padding
+    np.clip(corners[:, 0::2], 0, width, out=corners[:, 0::2])
+    np.clip(corners[:, 1::2], 0, height, out=corners[:, 1::2])
+    return corners
+
+
+def crop_digits(source, corners, size=DIGIT_SIZE):
+    """Cut every padded box out of source into one (N, 28, 28) uint8 array."""
+    crops = np.empty((len(corners),) + (size[1], size[0]), dtype=np.uint8)
+    with stage('crop_resize', size=source.nbytes, items=len(corners)):
+        for i, (x0, y0, x1, y1) in enumerate(corners):
+            cv2.resize(source[y0:y1, x0:x1], size, dst=crops[i])
+    return crops
+
+
+def segment_digits(gray, threshold='otsu', blur_ksize=None, erode_kernel=None,
+                   padding=0, crop_from='gray', min_area=1, min_size=1, size=DIGIT_SIZE):
+    """Find and crop every digit on a grayscale page.
+
+    crop_from: 'gray' to cut the crops from the grayscale page, or 'binary' to
+               cut them from the thresholded (and eroded) image
+
+    Returns a Segmentation of boxes, padded corners, crops and the binary image.
+    """
+    if crop_from not in ('gray', 'binary'):
+        raise ValueError(f"crop_from must be 'gray' or 'binary', got {crop_from!r}")
+
+    binary = binarize(gray, threshold=threshold, blur_ksize=blur_ksize, erode_kernel=erode_kernel)
+    boxes = find_boxes(binary, min_area=min_area, min_size=min_size)
+    corners = pad_boxes(boxes, padding, gray.shape)
+
+    source = gray if crop_from == 'gray' else binary
+    return Segmentation(boxes, corners, crop_digits(source, corners, size=size), binary)
+
+
+def draw_boxes(image, corners, color=(0, 255, 0), thickness=2):
+    """Draw the (x0, y0, x1, y1) boxes on image in place and return it."""
+    for x0, y0, x1, y1 in corners:
+        cv2.rectangle(image, (int(x0), int(y0)), (int(x1), int(y1)), color, thickness)
+    return image
+
@@ -0,0 +1,382 @@
+"""Tiled, multi-process segmentation of large scanned pages.
+
+A 300 DPI A4 scan is about 2500x3500 pixels. Blurring, thresholding and
+labelling it in one piece is slow and needs several full-page temporaries.
+segment_tiled splits the page into overlapping tiles and segments them in a
+process pool:
+
+* The blur runs once per tile with just enough halo for the kernel, and the
+  blurred cores are stitched into one page. The Otsu threshold is chosen
+  once from that page, so every tile binarises exactly as the whole page
+  would, and the binary crops are cut from it without blurring again.
+* An optional downscaled pass finds the regions of interest, and tiles that
+  contain no ink are skipped. It keeps the darkest pixel of every block, so
+  even single-pixel specks keep their tile.
+* Each tile owns the boxes whose centre falls in its core (the tile without
+  the overlap). As long as a digit fits inside the overlap it is seen whole by
+  its owner tile, so it is reported exactly once. Larger shapes that touch an
+  inner tile edge are merged across the seam instead, and specks inside their
+  holes are dropped as the whole page's hole filling would drop them.
+
+The result is the same Segmentation as segment_digits, except that binary is
+None because no full-page binary image is ever built. check_parity compares
+the two on a page.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from segmentation import DIGIT_SIZE, Segmentation, binarize, crop_digits, find_boxes, pad_boxes
+
+
+def _kernel_margin(blur_ksize, erode_kernel):
+    # Pixels near a tile edge that blur and erosion compute differently from
+    # the full page, because they see the tile border instead of the neighbours
+    margin = 1
+    if blur_ksize is not None:
+        margin += max(blur_ksize) // 2
+    if erode_kernel is not None:
+        margin += max(erode_kernel)
+    return margin
+
+
+def approximate_threshold(gray, blur_ksize=None, scale=0.25):
+    """Otsu threshold estimated on a downscaled copy of the page."""
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if blur_ksize is not None:
+        ksize = tuple(max(int(k * scale) // 2 * 2 + 1, 1) for k in blur_ksize)
+        small = cv2.GaussianBlur(small, ksize, 0)
+    value, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return int(value)
+
+
+def otsu_threshold(hist):
+    """Otsu threshold of a 256-bin histogram, the value cv2.threshold would pick."""
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    levels = np.arange(256)
+    weight0 = np.cumsum(hist)
+    weight1 = weight0[-1] - weight0
+    sum0 = np.cumsum(hist * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean0 = sum0 / weight0
+        mean1 = (sum0[-1] - sum0) / weight1
+        between = weight0 * weight1 * (mean0 - mean1) ** 2
+    return int(np.argmax(np.nan_to_num(between)))
+
+
+def _blur_tile(tile, core_in_tile, blur_ksize):
+    # Blur a tile with a halo of half the kernel and return its core, which
+    # then matches the same pixels of the whole blurred page exactly
+    x0, y0, x1, y1 = core_in_tile
+    return cv2.GaussianBlur(tile, tuple(blur_ksize), 0)[y0:y1, x0:x1]
+
+
+def _blur_tile_task(task):
+    return _blur_tile(*task)
+
+
+def regions_of_interest(gray, threshold, scale=0.125, dilation=3):
+    """Downscaled foreground mask used to skip tiles without any ink.
+
+    Each mask pixel covers a block of 1 / scale pixels on a side and is set
+    when the darkest pixel of the block is ink, so even a single-pixel speck
+    keeps its tile. Returns (mask, scale); mask is True where there is ink.
+    """
+    block = max(int(round(1 / scale)), 1)
+    height, width = gray.shape
+    padded = np.full((-(-height // block) * block, -(-width // block) * block), 255, np.uint8)
+    padded[:height, :width] = gray
+    # Rows first, then columns: two contiguous reductions are much faster
+    # than one over both block axes
+    rows = padded.reshape(-1, block, padded.shape[1]).min(axis=1)
+    darkest = rows.reshape(len(rows), -1, block).min(axis=2)
+    # The threshold is only an estimate, so be lenient with it
+    mask = (darkest <= min(threshold + 32, 254)).astype(np.uint8)
+    mask = cv2.dilate(mask, np.ones((dilation, dilation), np.uint8))
+    return mask > 0, 1 / block
+
+
+def tile_grid(shape, tile_size, overlap):
+    """Return (core, extended) rectangles as (x0, y0, x1, y1) for every tile."""
+    height, width = shape[:2]
+    tiles = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            core = (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            extended = (max(core[0] - overlap, 0), max(core[1] - overlap, 0),
+                        min(core[2] + overlap, width), min(core[3] + overlap, height))
+            tiles.append((core, extended))
+    return tiles
+
+
+def _segment_tile(tile, core, extended, page_shape, settings, margin, min_area, min_size):
+    """Find the boxes of one tile in page coordinates.
+
+    Returns (owned, fragments): owned are complete boxes whose centre lies in
+    the core, fragments are boxes cut by an inner tile edge.
+    """
+    boxes = find_boxes(binarize(tile, **settings), min_area=min_area, min_size=min_size)
+    if len(boxes) == 0:
+        return boxes, boxes
+
+    ex0, ey0, ex1, ey1 = extended
+    boxes = boxes + np.array([ex0, ey0, 0, 0])
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+
+    # A box is cut by the tile border if it comes within margin of an edge
+    # that is not also the page edge
+    height, width = page_shape[:2]
+    cut = np.zeros(len(boxes), dtype=bool)
+    if ex0 > 0:
+        cut |= x0 < ex0 + margin
+    if ey0 > 0:
+        cut |= y0 < ey0 + margin
+    if ex1 < width:
+        cut |= x1 > ex1 - margin
+    if ey1 < height:
+        cut |= y1 > ey1 - margin
+
+    cx, cy = x0 + boxes[:, 2] / 2, y0 + boxes[:, 3] / 2
+    in_core = (cx >= core[0]) & (cx < core[2]) & (cy >= core[1]) & (cy < core[3])
+    return boxes[in_core & ~cut], boxes[cut]
+
+
+def _segment_tile_task(task):
+    return _segment_tile(*task)
+
+
+def merge_fragments(fragments):
+    """Union boxes that overlap or touch into single (x, y, w, h) boxes."""
+    if len(fragments) == 0:
+        return fragments
+
+    boxes = np.unique(fragments, axis=0)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+
+    # Pairwise overlap test, then union-find over the overlapping pairs
+    overlaps = ((x0[:, None] <= x1[None, :]) & (x0[None, :] <= x1[:, None]) &
+                (y0[:, None] <= y1[None, :]) & (y0[None, :] <= y1[:, None]))
+    parent = np.arange(len(boxes))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(overlaps, 1))):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+
+    roots = np.array([find(i) for i in range(len(boxes))])
+    merged = []
+    for root in np.unique(roots):
+        members = roots == root
+        mx0, my0 = x0[members].min(), y0[members].min()
+        merged.append((mx0, my0, x1[members].max() - mx0, y1[members].max() - my0))
+    return np.array(merged, dtype=np.int64)
+
+
+def _contained(boxes, containers, tolerance=0):
+    """True for each box lying inside one of the containers grown by tolerance."""
+    if len(boxes) == 0 or len(containers) == 0:
+        return np.zeros(len(boxes), dtype=bool)
+    bx0, by0 = boxes[:, 0, None], boxes[:, 1, None]
+    bx1, by1 = bx0 + boxes[:, 2, None], by0 + boxes[:, 3, None]
+    cx0, cy0 = containers[None, :, 0] - tolerance, containers[None, :, 1] - tolerance
+    cx1 = containers[None, :, 0] + containers[None, :, 2] + tolerance
+    cy1 = containers[None, :, 1] + containers[None, :, 3] + tolerance
+    return ((bx0 >= cx0) & (by0 >= cy0) & (bx1 <= cx1) & (by1 <= cy1)).any(axis=1)
+
+
+def _in_holes(boxes, source, settings, margin, overlap):
+    """True for each box that lies in a hole of another shape on the whole page.
+
+    A tile cannot fill a hole that its border cuts open, so a speck inside the
+    loop of a shape crossing that border comes back as a box of its own. This
+    only happens for shapes larger than the overlap: any tile that sees the
+    speck whole sees a smaller shape around it whole too. Boxes inside such a
+    shape's box are checked again on its region, where find_boxes fills the
+    hole as segment_digits would.
+    """
+    hidden = np.zeros(len(boxes), dtype=bool)
+    if len(boxes) < 2:
+        return hidden
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    inside = ((x0[:, None] >= x0[None, :]) & (y0[:, None] >= y0[None, :]) &
+              (x1[:, None] <= x1[None, :]) & (y1[:, None] <= y1[None, :]))
+    area = boxes[:, 2] * boxes[:, 3]
+    inside &= area[:, None] < area[None, :]
+    inside &= (np.maximum(boxes[:, 2], boxes[:, 3]) > overlap)[None, :]
+
+    height, width = source.shape
+    for i, j in zip(*np.nonzero(inside)):
+        if hidden[i]:
+            continue
+        # One pixel beyond the margin keeps the region border off the shape
+        rx0, ry0 = max(x0[j] - margin - 1, 0), max(y0[j] - margin - 1, 0)
+        rx1, ry1 = min(x1[j] + margin + 1, width), min(y1[j] + margin + 1, height)
+        found = find_boxes(binarize(source[ry0:ry1, rx0:rx1], **settings))
+        box = boxes[i] - np.array([rx0, ry0, 0, 0])
+        hidden[i] = not (found == box).all(axis=1).any()
+    return hidden
+
+
+def _crop_binary(gray, corners, settings, margin, size):
+    # Binarise just the padded crop area (plus a margin for the blur and
+    # erosion kernels) instead of the whole page
+    height, width = gray.shape
+    crops = np.empty((len(corners), size[1], size[0]), dtype=np.uint8)
+    for i, (x0, y0, x1, y1) in enumerate(corners):
+        rx0, ry0 = max(x0 - margin, 0), max(y0 - margin, 0)
+        rx1, ry1 = min(x1 + margin, width), min(y1 + margin, height)
+        region = binarize(gray[ry0:ry1, rx0:rx1], **settings)
+        crops[i] = crop_digits(region, np.array([[x0 - rx0, y0 - ry0, x1 - rx0, y1 - ry0]]),
+                               size=size)[0]
+    return crops
+
+
+def segment_tiled(gray, tile_size=1024, overlap=128, workers=None, roi_scale=0.125,
+                  threshold='otsu', blur_ksize=None, erode_kernel=None, padding=0,
+                  crop_from='gray', min_area=1, min_size=1, size=DIGIT_SIZE, executor=None):
+    """Segment a large page tile by tile in a process pool.
+
+    tile_size: side of the square tile cores in pixels
+    overlap: extra pixels around each core; digits up to this size beyond
+             their owner core are found whole
+    workers: worker processes, defaults to the number of CPUs; 1 runs inline
+    roi_scale: scale of the downscaled pass that skips empty tiles, or None
+               to process every tile
+    executor: an existing process pool to run the tiles on, so that a
+              sequence of pages does not start a new pool per page
+
+    The remaining arguments are the same as for segment_digits.
+    """
+    if crop_from not in ('gray', 'binary'):
+        raise ValueError(f"crop_from must be 'gray' or 'binary', got {crop_from!r}")
+
+    def find_ink(tiles):
+        if not roi_scale:
+            return [True] * len(tiles)
+        ink = []
+        for _, extended in tiles:
+            x0, y0, x1, y1 = (int(v * scale) for v in extended)
+            ink.append(mask[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)].any())
+        return ink
+
+    if roi_scale:
+        # A rough threshold is good enough to tell blank tiles apart
+        rough = threshold if threshold != 'otsu' else approximate_threshold(gray, blur_ksize)
+        # Blurred ink can lie up to half the kernel away from the dark pixels
+        reach = max(blur_ksize) // 2 if blur_ksize is not None else 0
+        mask, scale = regions_of_interest(gray, int(rough), roi_scale,
+                                          dilation=3 + 2 * int(np.ceil(reach * roi_scale)))
+
+    tiles = tile_grid(gray.shape, tile_size, overlap)
+    ink = find_ink(tiles)
+
+    own_executor = None
+    if executor is None:
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and sum(ink) > 1:
+            executor = own_executor = ProcessPoolExecutor(max_workers=min(workers, sum(ink)))
+    if executor is None and all(ink):
+        # Inline on a page with ink everywhere, tiles would only add the
+        # overlap work, so treat the whole page as one tile
+        tile_size = max(gray.shape[:2])
+        tiles, ink = tile_grid(gray.shape, tile_size, 0), [True]
+    run = executor.map if executor is not None else map
+
+    try:
+        source = gray
+        if blur_ksize is not None:
+            # Blur every pixel exactly once: tiles only need half the kernel
+            # as halo, and their cores are stitched into one blurred page that
+            # the histogram, the box search and the binary crops all share.
+            # Blank tiles only matter to the Otsu histogram.
+            halo = max(blur_ksize) // 2
+            blur_tiles = tile_grid(gray.shape, tile_size, halo)
+            if threshold != 'otsu':
+                blur_tiles = [tile for tile, has_ink in zip(blur_tiles, find_ink(blur_tiles))
+                              if has_ink]
+            tasks = [(gray[ey0:ey1, ex0:ex1], (cx0 - ex0, cy0 - ey0, cx1 - ex0, cy1 - ey0),
+                      blur_ksize)
+                     for (cx0, cy0, cx1, cy1), (ex0, ey0, ex1, ey1) in blur_tiles]
+            source = gray.copy()
+            for ((x0, y0, x1, y1), _), block in zip(blur_tiles, run(_blur_tile_task, tasks)):
+                source[y0:y1, x0:x1] = block
+
+        if threshold == 'otsu':
+            threshold = otsu_threshold(cv2.calcHist([source], [0], None, [256], [0, 256]))
+        settings = dict(threshold=int(threshold), blur_ksize=None, erode_kernel=erode_kernel)
+        # Only the erosion still sees the tile border differently
+        margin = _kernel_margin(None, erode_kernel)
+
+        tasks = [(source[ey0:ey1, ex0:ex1], core, extended, gray.shape, settings, margin,
+                  min_area, min_size)
+                 for (core, extended), has_ink in zip(tiles, ink) if has_ink
+                 for ex0, ey0, ex1, ey1 in [extended]]
+        results = list(run(_segment_tile_task, tasks))
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+
+    empty = np.empty((0, 4), dtype=np.int64)
+    owned = np.concatenate([result[0] for result in results] + [empty])
+    fragments = np.concatenate([result[1] for result in results] + [empty])
+
+    # Shapes bigger than the overlap are only ever seen in pieces. Drop the
+    # pieces of digits another tile saw whole first, so that they cannot join
+    # up with pieces of a neighbour, then join what is left. Pieces can stick
+    # out of the whole digit by up to margin pixels, since erosion behaves
+    # differently at the tile border.
+    fragments = fragments[~_contained(fragments, owned, margin)]
+    merged = merge_fragments(fragments)
+
+    boxes = np.concatenate([owned, merged]).astype(np.int64)
+    boxes = boxes[~_in_holes(boxes, source, settings, margin, overlap)]
+    boxes = boxes[np.argsort(boxes[:, 0], kind='stable')]
+    corners = pad_boxes(boxes, padding, gray.shape)
+
+    if crop_from == 'gray':
+        crops = crop_digits(gray, corners, size=size)
+    else:
+        crops = _crop_binary(source, corners, settings, margin, size)
+    return Segmentation(boxes, corners, crops, None)
+
+
+def check_parity(gray, tiling=None, **settings):
+    """Compare segment_tiled with segment_digits on one page.
+
+    tiling: keyword arguments only segment_tiled takes (tile_size, overlap,
+            workers, roi_scale, executor)
+    settings: segmentation settings passed to both
+
+    Returns a dict with the boxes only one of them found and whether the
+    crops of the common boxes are identical; the two agree when both lists
+    are empty and crops_equal is True.
+    """
+    from segmentation import segment_digits
+
+    whole = segment_digits(gray, **settings)
+    tiled = segment_tiled(gray, **(tiling or {}), **settings)
+
+    def by_box(segmentation):
+        return {tuple(box): crop for box, crop in zip(segmentation.boxes.tolist(),
+                                                      segmentation.crops)}
+
+    whole_crops, tiled_crops = by_box(whole), by_box(tiled)
+    common = whole_crops.keys() & tiled_crops.keys()
+    return {
+        'boxes': len(whole_crops),
+        'missing': sorted(whole_crops.keys() - common),
+        'extra': sorted(tiled_crops.keys() - common),
+        'crops_equal': all(np.array_equal(whole_crops[box], tiled_crops[box]) for box in common),
+    }